@@ -0,0 +1,153 @@
+import numpy as np
+from collections import defaultdict
+from tracker import KalmanTracker
+
+class FrequencyIndex:
+    """
+    Log-frequency bucket index of station peaks.
+
+    Buckets are `tolerance` wide in relative frequency, so every peak within
+    tolerance of a query lies in the query's bucket or one of its two neighbours.
+    Candidate lookup is O(1) per peak instead of comparing every pair of peaks.
+    """
+    def __init__(self, tolerance=0.03):
+        self.tolerance = tolerance
+        self._log_width = np.log1p(tolerance)
+        self.buckets = defaultdict(list)
+
+    def _bucket(self, freq):
+        return int(np.floor(np.log(freq) / self._log_width))
+
+    def add(self, freq, item):
+        self.buckets[self._bucket(freq)].append((freq, item))
+
+    def query(self, freq):
+        """Items whose frequency is within the relative tolerance of freq"""
+        b = self._bucket(freq)
+        return [item for bucket in (b - 1, b, b + 1) for f, item in self.buckets.get(bucket, ())
+                if abs(f - freq) <= self.tolerance * freq]
+
+def associate_peaks(reports, tolerance=0.03):
+    """
+    Group per-station peaks that belong to the same drone.
+
+    Peaks are processed strongest first. Each unassigned peak seeds a group, which then
+    takes at most one peak per other station: the unassigned peak closest in frequency
+    from the seed's frequency bucket neighbourhood.
+
+    Args:
+        reports (dict): {station: [(fundamental, snr_dB, confidence, power_dB), ...]}
+        tolerance (float): Relative frequency tolerance (covers Doppler spread between stations)
+    Returns:
+        list: Groups as {station: peak} dicts, strongest seed first
+    """
+    index = FrequencyIndex(tolerance)
+    peaks = []
+    for station, station_peaks in reports.items():
+        for peak in station_peaks:
+            item = len(peaks)
+            peaks.append((station, peak))
+            index.add(peak[0], item)
+
+    assigned = np.zeros(len(peaks), dtype=bool)
+    groups = []
+    for item in sorted(range(len(peaks)), key=lambda p: -peaks[p][1][1]):
+        if assigned[item]:
+            continue
+        station, peak = peaks[item]
+        assigned[item] = True
+        group = {station: peak}
+
+        best = {}
+        for candidate in index.query(peak[0]):
+            if assigned[candidate]:
+                continue
+            other_station, other_peak = peaks[candidate]
+            if other_station in group:
+                continue
+            distance = abs(other_peak[0] - peak[0])
+            if other_station not in best or distance < best[other_station][0]:
+                best[other_station] = (distance, candidate)
+        for other_station, (_, candidate) in best.items():
+            assigned[candidate] = True
+            group[other_station] = peaks[candidate][1]
+        groups.append(group)
+    return groups
+
+class MultiTargetTracker:
+    """
+    One Kalman track per drone, with global-nearest-neighbour fix-to-track assignment.
+
+    The assignment cost combines the position Mahalanobis distance (normalized innovation
+    squared) with the relative mismatch of the rotor fundamental. Pairs outside the gate
+    are never assigned. Unassigned fixes start new tracks, and tracks without an update
+    for max_age seconds are dropped.
+    """
+    def __init__(self, process_noise=1.0, gate=13.8, freq_tolerance=0.05, max_age=3.0, max_targets=5):
+        """
+        Args:
+            process_noise (float): Acceleration noise of every track's Kalman filter
+            gate (float): Chi-square gate on the position innovation (13.8 = 99.9% for 2 DOF)
+            freq_tolerance (float): Relative fundamental mismatch that costs as much as the gate
+            max_age (float): Seconds without an update before a track is dropped
+            max_targets (int): Maximum number of simultaneous tracks
+        """
+        self.process_noise = process_noise
+        self.gate = gate
+        self.freq_tolerance = freq_tolerance
+        self.max_age = max_age
+        self.max_targets = max_targets
+        self.tracks = []  # dicts: id, filter, freq, last_update
+        self._next_id = 1
+
+    def update(self, fixes, timestamp):
+        """
+        Assign fixes to tracks and update them.
+
+        Args:
+            fixes (list): (position [2], covariance [2, 2], fundamental Hz) per detected target
+            timestamp (float): Fix time in seconds
+        Returns:
+            list: Current tracks
+        """
+        for track in self.tracks:
+            track['filter'].predict(timestamp)
+
+        n_tracks, n_fixes = len(self.tracks), len(fixes)
+        assigned_fixes = set()
+        if n_tracks and n_fixes:
+            from scipy.optimize import linear_sum_assignment  # Slow to import; only needed with tracks and fixes
+            cost = np.full((n_tracks, n_fixes), np.inf)
+            for t, track in enumerate(self.tracks):
+                for f, (position, covariance, freq) in enumerate(fixes):
+                    _, _, nis = track['filter'].innovation(position, covariance)
+                    freq_cost = self.gate * abs(freq - track['freq']) / (self.freq_tolerance * track['freq'])
+                    if nis <= self.gate and freq_cost <= self.gate:
+                        cost[t, f] = nis + freq_cost
+            finite = np.where(np.isfinite(cost), cost, 1e12)
+            rows, cols = linear_sum_assignment(finite)
+            for t, f in zip(rows, cols):
+                if np.isfinite(cost[t, f]):
+                    position, covariance, freq = fixes[f]
+                    track = self.tracks[t]
+                    track['filter'].update(position, covariance, timestamp)
+                    track['freq'] += 0.3 * (freq - track['freq'])
+                    track['last_update'] = timestamp
+                    track['hits'] += 1
+                    assigned_fixes.add(f)
+
+        for f, (position, covariance, freq) in enumerate(fixes):
+            if f in assigned_fixes or len(self.tracks) >= self.max_targets:
+                continue
+            kalman = KalmanTracker(self.process_noise)
+            kalman.update(position, covariance, timestamp)
+            self.tracks.append({'id': self._next_id, 'filter': kalman, 'freq': freq,
+                                'last_update': timestamp, 'hits': 1})
+            self._next_id += 1
+
+        self.tracks = [t for t in self.tracks if timestamp - t['last_update'] <= self.max_age]
+        return self.tracks
+
+    def positions_at(self, timestamp):
+        """Predicted (track id, x, y) of every track at `timestamp`"""
+        return [(t['id'], *t['filter'].position_at(timestamp)) for t in self.tracks]
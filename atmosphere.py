@@ -1,7 +1,8 @@
 import numpy as np
-import matplotlib.pyplot as plt
+from collections import OrderedDict
+from threading import Lock
 
-# Function to calculate air absorption in dB/km
+# Function to calculate air absorption in dB/km (vectorized over numpy arrays of any of the arguments)
 def air_absorption(frequency, temperature, humidity):
     # Parameters for absorption coefficient based on empirical data
     alpha_0 = 0.0001  # Base absorption coefficient in dB/m/Hz^2 at reference conditions
@@ -27,22 +28,124 @@ def total_attenuation(frequency, distance, temperature, humidity):
     total_loss = air_absorption_loss + inverse_square_loss
     return total_loss
 
-# Environmental variables for modeling
-frequencies = np.arange(100, 20000, 100)  # Frequency range from 100 Hz to 20 kHz
-distance = 1000  # Distance in meters (1 km)
-temperature = 20  # Constant temperature of 20°C
-humidity_levels = [20, 40, 60, 80]  # Different humidity levels to analyze
-
-# Plotting the results
-plt.figure(figsize=(12, 8))
-for humidity in humidity_levels:
-    attenuation_values = [total_attenuation(freq, distance, temperature, humidity) for freq in frequencies]
-    plt.plot(frequencies, attenuation_values, label=f'Humidity {humidity}%')
-
-plt.title('Total Sound Attenuation as a Function of Frequency and Humidity')
-plt.xlabel('Frequency (Hz)')
-plt.ylabel('Total Attenuation (dB)')
-plt.xscale('log')
-plt.grid(True, which='both', linestyle='--')
-plt.legend()
-plt.show()
\ No newline at end of file
+class AttenuationTable:
+    """
+    Air absorption precomputed on a (temperature, humidity, frequency) grid.
+
+    The frequency axis is fixed when the table is built (normally the FFT bin grid), so the
+    absorption spectrum for one weather condition is a bilinear blend of four grid rows.
+    Those per-condition slices are cached with least-recently-used eviction, and refresh()
+    switches the current condition when a station reports new weather. Losses for whole
+    spectra (or batches of frames) are then array operations with no per-bin Python work.
+    The cache and the current condition are guarded by a lock, since the audio path, the
+    receiver's per-station lookups and weather updates run on different threads.
+    """
+    def __init__(self, frequencies, temperatures=np.arange(-20.0, 50.0, 5.0), humidities=np.arange(0.0, 105.0, 10.0),
+                 temperature=20.0, humidity=50.0, cache_size=32):
+        """
+        Args:
+            frequencies (array-like): [n_freqs] frequencies in Hz
+            temperatures (array-like): Temperature grid in deg C (ascending)
+            humidities (array-like): Relative humidity grid in % (ascending)
+            temperature, humidity: Initial weather condition
+            cache_size (int): Per-condition slices kept
+        """
+        self.frequencies = np.asarray(frequencies, dtype=float)
+        self.temperatures = np.asarray(temperatures, dtype=float)
+        self.humidities = np.asarray(humidities, dtype=float)
+        # [n_temperatures, n_humidities, n_freqs] absorption in dB/m
+        self.table = air_absorption(self.frequencies[None, None, :], self.temperatures[:, None, None],
+                                    self.humidities[None, :, None]) / 1000
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = Lock()
+        self.refresh(temperature, humidity)
+
+    @staticmethod
+    def _locate(grid, value):
+        """Lower grid index and interpolation fraction of value (clamped to the grid)"""
+        value = np.clip(value, grid[0], grid[-1])
+        i = int(np.clip(np.searchsorted(grid, value) - 1, 0, len(grid) - 2))
+        return i, (value - grid[i]) / (grid[i + 1] - grid[i])
+
+    def absorption(self, temperature=None, humidity=None):
+        """
+        Absorption spectrum for one weather condition (the current one by default).
+
+        Returns:
+            ndarray: [n_freqs] absorption in dB/m (shared cached array, do not modify)
+        """
+        with self._lock:
+            temperature = self.temperature if temperature is None else temperature
+            humidity = self.humidity if humidity is None else humidity
+            key = (round(float(temperature), 1), round(float(humidity), 1))
+            absorption = self._cache.get(key)
+            if absorption is not None:
+                self._cache.move_to_end(key)
+                return absorption
+
+            i, a = self._locate(self.temperatures, key[0])
+            j, b = self._locate(self.humidities, key[1])
+            rows = self.table[i:i + 2, j:j + 2]
+            absorption = ((1 - a) * ((1 - b) * rows[0, 0] + b * rows[0, 1])
+                          + a * ((1 - b) * rows[1, 0] + b * rows[1, 1]))
+            absorption.flags.writeable = False
+            self._cache[key] = absorption
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return absorption
+
+    def refresh(self, temperature, humidity):
+        """Make (temperature, humidity) the current condition, e.g. when a station reports new weather"""
+        with self._lock:
+            self.temperature = float(temperature)
+            self.humidity = float(humidity)
+        return self.absorption(temperature, humidity)
+
+    def attenuation(self, distance, temperature=None, humidity=None):
+        """
+        Total loss (spherical spreading plus absorption) in dB, as total_attenuation.
+
+        Args:
+            distance (float or ndarray): Distance(s) in meters
+        Returns:
+            ndarray: [..., n_freqs] loss for every distance
+        """
+        distance = np.asarray(distance, dtype=float)[..., None]
+        return self.absorption(temperature, humidity) * distance + 20 * np.log10(distance)
+
+    def compensate(self, spectra_dB, distance, temperature=None, humidity=None):
+        """
+        Undo the frequency-dependent absorption of spectra heard at `distance`.
+
+        Args:
+            spectra_dB (ndarray): [..., n_freqs] spectra in dB on this table's frequencies
+            distance (float or ndarray): Source distance in meters (per frame if an array)
+        Returns:
+            ndarray: Spectra with the absorption added back
+        """
+        distance = np.asarray(distance, dtype=float)[..., None]
+        return spectra_dB + self.absorption(temperature, humidity) * distance
+
+if __name__ == "__main__":
+    import matplotlib.pyplot as plt
+
+    # Environmental variables for modeling
+    frequencies = np.arange(100, 20000, 100)  # Frequency range from 100 Hz to 20 kHz
+    distance = 1000  # Distance in meters (1 km)
+    temperature = 20  # Constant temperature of 20°C
+    humidity_levels = [20, 40, 60, 80]  # Different humidity levels to analyze
+
+    # Plotting the results
+    plt.figure(figsize=(12, 8))
+    for humidity in humidity_levels:
+        attenuation_values = total_attenuation(frequencies, distance, temperature, humidity)
+        plt.plot(frequencies, attenuation_values, label=f'Humidity {humidity}%')
+
+    plt.title('Total Sound Attenuation as a Function of Frequency and Humidity')
+    plt.xlabel('Frequency (Hz)')
+    plt.ylabel('Total Attenuation (dB)')
+    plt.xscale('log')
+    plt.grid(True, which='both', linestyle='--')
+    plt.legend()
+    plt.show()
\ No newline at end of file
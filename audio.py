@@ -1,61 +1,346 @@
 import sounddevice as sd
 import numpy as np
-import matplotlib.pyplot as plt
-from queue import Queue, Empty
-from scipy.fft import fft
-import pandas as pd
-from filter import match_signal_shape, read_and_process_data
+from time import time as wall_time
+from scipy.fft import rfft, rfftfreq
+from filter import TemplateBank, load_reference_spectra
+from ranging import SpectralRangeEstimator
+from atmosphere import AttenuationTable
+from ringbuffer import RingBuffer
+from harmonic import HarmonicDetector
+from refine import interpolate_peak, frequency_uncertainty, zoom_peak, INTERPOLATION_BIAS_BINS
 best_peak = 0
 peak_freq = 0
 
+class SpectralEngine:
+    """
+    Precomputed real-input FFT for fixed-size audio blocks.
+
+    The window, frequency bins and band index slices are built once for a given
+    (buffer_size, sample_rate, band), so the per-block path is one window multiply,
+    one rfft and a slice. Output magnitude buffers are reused between calls.
+    """
+    def __init__(self, buffer_size, sample_rate, freq_min, freq_max, max_freq_collected, workers=-1):
+        self.key = (buffer_size, sample_rate, freq_min, freq_max, max_freq_collected)
+        self.buffer_size = buffer_size
+        self.sample_rate = sample_rate
+        self.workers = workers
+        self.window = np.hanning(buffer_size)
+
+        # Keep bins from 0 Hz up to max_freq_collected (rfftfreq is sorted ascending)
+        all_freqs = rfftfreq(buffer_size, 1/sample_rate)
+        self.n_bins = int(np.searchsorted(all_freqs, max_freq_collected, side='right'))
+        self.freqs = all_freqs[:self.n_bins]
+        self.bin_width = sample_rate / buffer_size
+
+        self._band_slices = {}
+        self.band = self.band_slice(freq_min, freq_max)
+
+        # Preallocated work buffers
+        self._windowed = np.empty(buffer_size)
+        self._mag = np.empty(self.n_bins)
+
+    def band_slice(self, band_min, band_max):
+        """Return the slice of self.freqs covering [band_min, band_max]"""
+        band = self._band_slices.get((band_min, band_max))
+        if band is None:
+            lo = int(np.searchsorted(self.freqs, band_min, side='left'))
+            hi = int(np.searchsorted(self.freqs, band_max, side='right'))
+            band = self._band_slices[(band_min, band_max)] = slice(lo, hi)
+        return band
+
+    def transform(self, audio_data):
+        """
+        Window and rFFT one block of buffer_size samples.
+
+        Returns:
+            tuple: (freqs, fft_mag, fft_data) where fft_mag is in dB and is
+                   overwritten by the next call.
+        """
+        np.multiply(audio_data, self.window, out=self._windowed)
+        fft_data = rfft(self._windowed, overwrite_x=True, workers=self.workers)[:self.n_bins]
+
+        np.abs(fft_data, out=self._mag)
+        self._mag += 1e-10
+        np.log10(self._mag, out=self._mag)
+        self._mag *= 20
+        return self.freqs, self._mag, fft_data
+
+    def transform_frames(self, frames):
+        """
+        Window and rFFT a 2-D block of frames in one call.
+
+        Args:
+            frames (ndarray): [n_frames, buffer_size] audio samples
+        Returns:
+            tuple: (freqs, fft_mag [n_frames, n_bins] in dB, fft_data [n_frames, n_bins])
+        """
+        windowed = frames * self.window
+        fft_data = rfft(windowed, axis=-1, overwrite_x=True, workers=self.workers)[..., :self.n_bins]
+        fft_mag = 20 * np.log10(np.abs(fft_data) + 1e-10)
+        return self.freqs, fft_mag, fft_data
+
+    def band_peaks(self, fft_data, band=None):
+        """
+        Peak frequency, peak power and total power inside a band for every frame.
+
+        Args:
+            fft_data (ndarray): [..., n_bins] complex spectra from transform/transform_frames
+            band (slice): Bin slice, defaults to the engine's detection band
+        Returns:
+            tuple: (peak_freqs, peak_powers, total_powers) arrays over the leading axes,
+                   or (None, None, None) if the band is empty
+        """
+        band = self.band if band is None else band
+        band_mag = np.abs(fft_data[..., band])
+        if band_mag.shape[-1] == 0:
+            return None, None, None
+
+        peak_idx = np.argmax(band_mag, axis=-1)
+        peak_mag = np.take_along_axis(band_mag, peak_idx[..., None], axis=-1)[..., 0]
+        peak_freqs = self.freqs[band][peak_idx]
+        peak_powers = 20 * np.log10(peak_mag + 1e-10)
+        total_powers = 20 * np.log10(np.sum(band_mag, axis=-1) + 1e-10)
+        return peak_freqs, peak_powers, total_powers
+
 class AudioProcessor:
-    def __init__(self, sample_rate=44100, duration=0.1, freq_min=500, freq_max=10000, max_freq_collected=10000):
+    def __init__(self, sample_rate=44100, duration=0.1, freq_min=500, freq_max=10000, max_freq_collected=10000,
+                 overlap=0.5, ring_seconds=2.0, n_harmonics=5, min_snr_dB=10.0, min_confidence=0.5,
+                 refine_method='gaussian', zoom_refine=False, channels=1, average_channels=True, max_targets=1,
+                 temperature=20.0, humidity=50.0):
+        """
+        Args:
+            sample_rate (int): Audio sample rate in Hz
+            duration (float): FFT frame length in seconds
+            freq_min, freq_max (float): Detection band in Hz
+            max_freq_collected (float): Highest FFT bin kept in Hz
+            overlap (float): Fraction of overlap between consecutive frames (0 to <1)
+            ring_seconds (float): Capacity of the audio ring buffer in seconds
+            n_harmonics (int): Harmonics scored by the drone signature detector
+            min_snr_dB (float): Harmonic SNR required to report a detection
+            min_confidence (float): Fraction of harmonics above the noise floor required to report a detection
+            refine_method (str): Sub-bin peak interpolation, 'parabolic' or 'gaussian' (quadratic-log)
+            zoom_refine (bool): Additionally refine the peak with a zoom FFT around it
+            channels (int): Number of input channels (microphones) processed together
+            average_channels (bool): Average power spectra across channels for SNR gain; otherwise
+                                     the channel with the strongest peak is reported
+            max_targets (int): Distinct rotor signatures reported per frame in `peaks` (for multi-drone tracking)
+            temperature (float): Air temperature in deg C (atmospheric absorption, see set_weather)
+            humidity (float): Relative humidity in % (atmospheric absorption, see set_weather)
+        """
+        if not 0 <= overlap < 1:
+            raise ValueError("overlap must be in [0, 1)")
         self.sample_rate = sample_rate
         self.duration = duration
         self.buffer_size = int(sample_rate * duration)
+        self.hop_size = max(1, int(round(self.buffer_size * (1 - overlap))))
         self.freq_min = freq_min
         self.freq_max = freq_max
         self.max_freq_collected = max_freq_collected
-        self.data_queue = Queue()
+        self.channels = channels
+        self.average_channels = average_channels
+        self.ring = RingBuffer(max(int(sample_rate * ring_seconds), 2 * self.buffer_size), channels)
+        frame_shape = (self.buffer_size,) if channels == 1 else (channels, self.buffer_size)
+        self._frames = np.zeros((self.ring.capacity // self.hop_size + 1,) + frame_shape)
+        self.n_harmonics = n_harmonics
+        self.min_snr_dB = min_snr_dB
+        self.min_confidence = min_confidence
+        self.refine_method = refine_method
+        self.zoom_refine = zoom_refine
+        self.refined_peak = {'freq': None, 'uncertainty': None}
+        self.last_spectra = None
+        self.last_detections = None
+        self.channel_peaks = None
+        self.reference_channels = None
+        self.latest_frame = None   # Reference-channel samples of the most recent frame
+        self.frame_time = None     # Wall-clock capture time of latest_frame's first sample
+        self.clock_anchor = None   # (ring write position, wall-clock time) at the last callback
+        self.recorder = None       # Optional recording.Recorder that receives every input block
+        self.detection = {'fundamental': None, 'snr_dB': None, 'confidence': None, 'detected': False}
+        self.max_targets = max_targets
+        self.peaks = []  # [fundamental, snr_dB, confidence, power_dB] of each detected signature, strongest first
+        self.engine = SpectralEngine(self.buffer_size, sample_rate, freq_min, freq_max, max_freq_collected)
+        self.detector = HarmonicDetector(self.engine.freqs, freq_min, freq_max, n_harmonics)
         
-        # Add reference data loading
-        self.df, _, self.freq_mask, _ = self.load_reference_data()
+        # Reference spectra (distances, frequencies, amplitudes) shared by every processor
+        self.reference = self.load_reference_data()
+        self.temperature = temperature
+        self.humidity = humidity
+        self.attenuation = None  # atmosphere.AttenuationTable on the FFT bin grid
+        self.template_bank = None
+        self.range_estimator = None
+        self._build_reference_models()
+        self.template_match = None  # (template distance, correlation) of the latest plotted frame
+        self.range_estimate = (None, None)  # (range m, one-sigma uncertainty m) of the latest frame
 
     def load_reference_data(self):
-        """Load and process reference data"""
+        """Load the reference spectra, or None if the file is missing"""
         try:
-            return read_and_process_data('fft_amplitudes_1.csv')
+            return load_reference_spectra('fft_amplitudes_1.csv')
         except FileNotFoundError:
-            print("Warning: Reference data file not found. Matched signal overlay disabled.")
-            return None, None, None, None
+            print("Warning: Reference data file not found. Matched signal overlay and spectral ranging disabled.")
+            return None
+
+    def spectral_engine(self):
+        """Return the spectral engine, rebuilding it only if the block size, sample rate or band changed"""
+        key = (self.buffer_size, self.sample_rate, self.freq_min, self.freq_max, self.max_freq_collected)
+        if self.engine.key != key:
+            self.engine = SpectralEngine(*key)
+            self.detector = HarmonicDetector(self.engine.freqs, self.freq_min, self.freq_max, self.n_harmonics)
+            self._build_reference_models()
+        return self.engine
+
+    def _build_reference_models(self):
+        """Build the attenuation table and resample the reference spectra onto the current FFT grid"""
+        self.attenuation = AttenuationTable(self.engine.freqs, temperature=self.temperature, humidity=self.humidity)
+        if self.reference is None:
+            return
+        self.template_bank = TemplateBank(*self.reference, self.engine.freqs)
+        self.range_estimator = SpectralRangeEstimator(*self.reference, self.engine.freqs, self.engine.band,
+                                                      attenuation=self.attenuation)
+
+    def set_weather(self, temperature, humidity):
+        """Switch the absorption used for range estimation and compensation to new weather"""
+        self.temperature = temperature
+        self.humidity = humidity
+        if self.range_estimator is not None:
+            self.range_estimator.refresh(temperature, humidity)
+        else:
+            self.attenuation.refresh(temperature, humidity)
+
+    def compensate_absorption(self, fft_mag, distance):
+        """
+        Spectra in dB with the air absorption over `distance` added back (current weather).
+
+        Args:
+            fft_mag (ndarray): [n_bins] or [n_frames, n_bins] spectra in dB on the engine's grid
+            distance (float or ndarray): Source distance in meters (per frame if an array)
+        """
+        return self.attenuation.compensate(fft_mag, distance)
 
     def process_audio_data(self, audio_data):
-        """Process raw audio data and return FFT results"""
-        # Apply Hanning window before FFT
-        window = np.hanning(len(audio_data))
-        windowed_data = audio_data * window
-        fft_data = fft(windowed_data)
-        
-        freqs = np.fft.fftfreq(self.buffer_size, 1/self.sample_rate)
-        freq_mask = (freqs >= 0) & (freqs <= self.max_freq_collected)
-        
-        freqs = freqs[freq_mask]
-        fft_data = fft_data[freq_mask]
-        fft_mag = 20 * np.log10(np.abs(fft_data) + 1e-10)
-        
-        return freqs, fft_mag, fft_data
+        """Process raw audio data (buffer_size samples) and return FFT results"""
+        return self.spectral_engine().transform(audio_data)
+
+    def process_frames(self, frames):
+        """
+        Vectorized equivalent of process_audio_data + get_range_peak for many frames.
+
+        Multi-channel frames are transformed with a single 2-D rFFT. Per-channel peaks are
+        kept in self.channel_peaks and the returned values come from the channel-averaged
+        power spectrum (average_channels) or from the strongest channel of each frame.
+
+        Args:
+            frames (ndarray): [n_frames, buffer_size] or [n_frames, channels, buffer_size] audio samples
+        Returns:
+            tuple: (peak_freqs, peak_powers, total_powers) arrays of length n_frames
+        """
+        engine = self.spectral_engine()
+        frames = np.asarray(frames)
+        freqs, fft_mag, fft_data = engine.transform_frames(frames if frames.ndim > 1 else frames[None])
+
+        if fft_data.ndim == 3:
+            self.channel_peaks = engine.band_peaks(fft_data)
+            if self.channel_peaks[1] is None:
+                # Empty band: no channel to pick, same (None, None, None) as the single-channel path
+                self.reference_channels = None
+                return self.channel_peaks
+            self.reference_channels = np.argmax(self.channel_peaks[1], axis=1)
+            if self.average_channels:
+                # Incoherent average: magnitude of the mean power spectrum
+                fft_data = np.sqrt(np.mean(np.abs(fft_data) ** 2, axis=1))
+                fft_mag = 20 * np.log10(fft_data + 1e-10)
+            else:
+                frame_idx = np.arange(len(fft_data))
+                fft_data = fft_data[frame_idx, self.reference_channels]
+                fft_mag = fft_mag[frame_idx, self.reference_channels]
+        self.last_spectra = (freqs, fft_mag, fft_data)
+        self.last_detections = self.detector.detect(fft_data)
+        return engine.band_peaks(fft_data)
+
+    def refine_peak(self, audio_data, fft_data, peak_freq):
+        """
+        Refine a peak found on the FFT bin grid to sub-bin precision.
+
+        Args:
+            audio_data (ndarray): The buffer_size samples the spectrum was computed from
+                                  (only used for zoom refinement)
+            fft_data (ndarray): [n_bins] spectrum of audio_data (complex or magnitude)
+            peak_freq (float): Peak frequency on the bin grid (e.g. from get_range_peak)
+        Returns:
+            tuple: (refined frequency Hz, one-sigma uncertainty Hz)
+        """
+        engine = self.spectral_engine()
+        peak_idx = int(round(peak_freq / engine.bin_width))
+        freq = interpolate_peak(fft_data, peak_idx, self.refine_method) * engine.bin_width
+
+        power = np.abs(fft_data) ** 2
+        noise_power = np.median(power[engine.band]) / np.log(2) + 1e-20
+        bias_bins = INTERPOLATION_BIAS_BINS[self.refine_method]
+        if self.zoom_refine:
+            freq, step = zoom_peak(audio_data, engine.window, freq, self.sample_rate)
+            bias_bins = INTERPOLATION_BIAS_BINS['gaussian'] * step / engine.bin_width
+        uncertainty = frequency_uncertainty(power[peak_idx], noise_power, self.buffer_size,
+                                            self.sample_rate, bias_bins)
+        return float(freq), float(uncertainty)
+
+    def get_harmonic_peak(self, fft_data):
+        """
+        Score the spectrum for a rotor signature (fundamental plus harmonics).
+
+        Returns:
+            tuple: (fundamental Hz, harmonic-weighted SNR in dB, confidence 0-1)
+        """
+        self.spectral_engine()
+        return self.detector.detect(fft_data)
+
+    def get_top_peaks(self, fft_data):
+        """
+        Up to max_targets distinct rotor signatures in one spectrum that pass the detection gate.
+
+        Returns:
+            list: [fundamental, snr_dB, confidence, power_dB] per signature, strongest first
+        """
+        found = self.detector.detect_top_k(fft_data, self.max_targets)
+        return [[float(v) for v in peak] for peak in zip(*found) if self.is_detection(peak[1], peak[2])]
+
+    def is_detection(self, snr_dB, confidence):
+        """Whether a harmonic detector result counts as a drone rather than noise"""
+        return bool(snr_dB is not None and snr_dB >= self.min_snr_dB and confidence >= self.min_confidence)
+
+    def process_signal(self, signal, batch_frames=256):
+        """
+        Process a long recorded signal at the stream's frame size and hop.
+
+        Frames are zero-copy views of `signal` and are processed batch_frames at a time.
+
+        Returns:
+            tuple: (peak_freqs, peak_powers, total_powers) arrays, one entry per frame
+        """
+        signal = np.asarray(signal, dtype=float)
+        if len(signal) < self.buffer_size:
+            empty = np.empty(0)
+            return empty, empty, empty
+        frames = np.lib.stride_tricks.sliding_window_view(signal, self.buffer_size)[::self.hop_size]
+        results = [self.process_frames(frames[i:i + batch_frames])
+                   for i in range(0, len(frames), batch_frames)]
+        return tuple(np.concatenate(r) for r in zip(*results))
 
     def get_range_peak(self, fft_data, freqs, band_min, band_max):
         """Find peak frequency and power within specified frequency band"""
         global best_peak, peak_freq  # Declare globals at start of function
         
-        mask = (freqs >= band_min) & (freqs <= band_max)
-        masked_fft = np.abs(fft_data[mask])
+        engine = self.spectral_engine()
+        if freqs is engine.freqs:
+            band = engine.band_slice(band_min, band_max)
+        else:
+            band = slice(np.searchsorted(freqs, band_min, side='left'),
+                         np.searchsorted(freqs, band_max, side='right'))
+        masked_fft = np.abs(fft_data[band])
         if len(masked_fft) == 0:
             return None, None, None
         
         peak_idx = np.argmax(masked_fft)
-        peak_freq = freqs[mask][peak_idx]
+        peak_freq = freqs[band][peak_idx]
         peak_power = 20 * np.log10(masked_fft[peak_idx] + 1e-10)
 
         # Calculate matched signal and correlation
@@ -79,15 +364,34 @@ class AudioProcessor:
     def audio_callback(self, indata, frames, time, status):
         if status:
             print(status)
-        self.data_queue.put(indata[:, 0])
+        now = wall_time()
+        start_pos = self.ring.write_pos
+        block = indata[:, 0] if self.channels == 1 else indata[:, :self.channels]
+        self.ring.push(block)
+        adc_time = getattr(time, 'inputBufferAdcTime', 0.0)
+        if adc_time > 0:
+            # Driver capture time of the block's first sample, moved from the stream clock to the wall clock
+            self.clock_anchor = (start_pos, now - (time.currentTime - adc_time))
+        else:
+            # The sample just past the end of this block was captured at roughly "now"
+            self.clock_anchor = (self.ring.write_pos, now)
+        if self.recorder is not None:
+            anchor_pos, anchor_time = self.clock_anchor
+            self.recorder.write_audio(anchor_time - (anchor_pos - start_pos) / self.sample_rate, block,
+                                      self.sample_rate)
+
+    def backlog(self):
+        """Number of complete frames waiting in the ring buffer"""
+        return self.ring.frames_available(self.buffer_size, self.hop_size)
 
     def stream_audio(self, plot=False):
         if plot:
+            import matplotlib.pyplot as plt
             fig, line_time, line_freq, peak_point, line_db, matched_line = self._setup_plot()
         
         try:
             with sd.InputStream(callback=self.audio_callback, 
-                              channels=1, 
+                              channels=self.channels, 
                               samplerate=self.sample_rate):
                 print("Streaming audio... Press Ctrl+C to stop.")
                 while True:
@@ -99,25 +403,64 @@ class AudioProcessor:
 
     def _update_stream(self, plot, fig=None, line_time=None, line_freq=None, 
                       peak_point=None, line_db=None, matched_line=None):
-        try:
-            data = self.data_queue.get_nowait()
-            if len(data) != self.buffer_size:
-                data = np.resize(data, self.buffer_size)
-            
-            freqs, fft_mag, fft_data = self.process_audio_data(data)
-            peak_freq, peak_power, total_power = self.get_range_peak(fft_data, freqs, 
-                                                      self.freq_min, self.freq_max)
-            
-            if plot:
-                self._update_plots(data, freqs, fft_mag, peak_freq, peak_power, total_power,
-                                 fig, line_time, line_freq, peak_point, line_db, matched_line)
-            
-            return peak_freq, peak_power, total_power
-            
-        except Empty:
+        """Drain every frame waiting in the ring buffer, process them as one batch and return the latest peak"""
+        first_pos = self.ring.read_pos
+        n_frames = 0
+        while n_frames < len(self._frames) and self.ring.read_frame(self._frames[n_frames], self.hop_size):
+            n_frames += 1
+        if n_frames == 0:
             return None, None, None
 
+        frames = self._frames[:n_frames]
+        peak_freqs, peak_powers, total_powers = self.process_frames(frames)
+        if peak_freqs is None:
+            return None, None, None
+        self._track_best_peak(peak_freqs, peak_powers)
+
+        fundamentals, snrs_dB, confidences = self.last_detections
+        if fundamentals is not None:
+            self.detection = {
+                'fundamental': float(fundamentals[-1]),
+                'snr_dB': float(snrs_dB[-1]),
+                'confidence': float(confidences[-1]),
+                'detected': self.is_detection(snrs_dB[-1], confidences[-1])
+            }
+        if self.max_targets > 1:
+            self.peaks = self.get_top_peaks(self.last_spectra[2][-1])
+
+        if self.range_estimator is not None:
+            self.range_estimate = self.range_estimator.estimate(self.last_spectra[1][-1])
+
+        peak_freq, peak_power, total_power = peak_freqs[-1], peak_powers[-1], total_powers[-1]
+        latest = frames[-1] if self.channels == 1 else frames[-1][self.reference_channels[-1]]
+        self.latest_frame = latest
+        if self.clock_anchor is not None:
+            anchor_pos, anchor_time = self.clock_anchor
+            latest_pos = first_pos + (n_frames - 1) * self.hop_size
+            self.frame_time = anchor_time + (latest_pos - anchor_pos) / self.sample_rate
+        peak_freq, uncertainty = self.refine_peak(latest, self.last_spectra[2][-1], peak_freq)
+        self.refined_peak = {'freq': peak_freq, 'uncertainty': uncertainty}
+        if plot:
+            freqs, fft_mag, _ = self.last_spectra
+            self._update_plots(latest, freqs, fft_mag[-1], peak_freq, peak_power, total_power,
+                             fig, line_time, line_freq, peak_point, line_db, matched_line)
+        
+        return peak_freq, peak_power, total_power
+
+    def _track_best_peak(self, peak_freqs, peak_powers):
+        """Update the global best peak from a batch of frames"""
+        global best_peak, peak_freq
+        in_band = peak_freqs > self.freq_min
+        if not np.any(in_band):
+            return
+        i = np.argmax(np.where(in_band, peak_powers, -np.inf))
+        if peak_powers[i] > best_peak:
+            best_peak = peak_powers[i]
+            peak_freq = peak_freqs[i]
+            print(f"New best peak: {best_peak} at {peak_freq} Hz")
+
     def _setup_plot(self):
+        import matplotlib.pyplot as plt
         global ax1, ax2
         plt.ion()
         fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 8))
@@ -150,10 +493,9 @@ class AudioProcessor:
         ax1.set_title("Real-Time Audio Signal and Power")
         
         # Frequency domain plot - limit to 10000 Hz
-        freqs = np.fft.fftfreq(self.buffer_size, 1/self.sample_rate)
-        freq_mask = (freqs >= 0) & (freqs <= self.max_freq_collected)
-        line_freq, = ax2.plot(freqs[freq_mask], np.zeros(np.sum(freq_mask)), '-', label='Current Signal')
-        matched_line, = ax2.plot(freqs[freq_mask], np.zeros(np.sum(freq_mask)), '--', 
+        freqs = self.spectral_engine().freqs
+        line_freq, = ax2.plot(freqs, np.zeros(len(freqs)), '-', label='Current Signal')
+        matched_line, = ax2.plot(freqs, np.zeros(len(freqs)), '--', 
                                 alpha=0.7, label='Matched Reference', color='green')
         peak_point, = ax2.plot([], [], 'ro', markersize=10, label='Peak')
         ax2.set_xlim(0, self.max_freq_collected)
@@ -173,17 +515,11 @@ class AudioProcessor:
         peak_point.set_data([peak_freq], [peak_power])
         
         # Update matched signal if reference data is available
-        if self.df is not None:
-            matched_signal, correlation = match_signal_shape(np.power(10, fft_mag/20), self.df, 
-                                                 self.freq_mask, reference_distance=2)
-            
-            # Make sure matched_signal matches the frequency data length
-            if len(matched_signal) != len(freqs):
-                matched_signal = np.interp(
-                    np.linspace(0, 1, len(freqs)),
-                    np.linspace(0, 1, len(matched_signal)),
-                    matched_signal
-                )
+        if self.template_bank is not None:
+            measured = np.power(10, fft_mag/20)
+            best, correlation, distance = self.template_bank.match(measured)
+            self.template_match = (float(distance), float(correlation))
+            matched_signal = self.template_bank.matched_signal(measured, best)
             matched_line.set_ydata(20 * np.log10(matched_signal + 1e-10))
         
         # Ensure db_data matches the time domain data length
@@ -0,0 +1,328 @@
+import io
+import sys
+import json
+import time
+import platform
+import argparse
+import tracemalloc
+import contextlib
+import numpy as np
+import os
+import subprocess
+import audio
+from audio import AudioProcessor
+from filter import match_signal_shape, read_and_process_data
+from triangulate import triangulate_target
+from doppler import get_drone
+from protocol import encode_hello, encode_reports, decode_message, MSG_HELLO
+from simulate import Simulator
+
+# Benchmarks of the detection, localization, wire-format and fusion stages on fixed synthetic
+# inputs (seeded simulator audio and geometry), so numbers are comparable between versions.
+#
+#   python benchmark.py                          run every stage and print the table
+#   python benchmark.py --save baseline.json     also store the results
+#   python benchmark.py --compare baseline.json  flag stages whose p50 got slower than --tolerance
+#
+# Every stage reports p50/p99 latency per call, calls per second and the peak memory
+# allocated by one call (tracemalloc, measured in a separate pass so it does not skew timing).
+# cold_start_sender times a headless sender's start-up in fresh interpreters; its alloc_kB is the
+# process peak RSS, and the run fails if it exceeds --cold-start-target or imports HEAVY_MODULES.
+
+FORMAT_VERSION = 1
+
+# Headless sender start-up (import plus GroundStation construction) must stay under this on a Raspberry Pi 4
+COLD_START_TARGET_MS = 1500.0
+# Modules a headless sender should never load
+HEAVY_MODULES = ('matplotlib', 'pandas', 'PyQt5', 'scipy.signal')
+
+_COLD_START = '''
+import time
+start = time.perf_counter()
+import sys, json, resource
+from ground import GroundStation
+station = GroundStation('sender', name='bench')
+elapsed = time.perf_counter() - start
+print(json.dumps({'seconds': elapsed, 'max_rss_kB': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  'heavy_modules': [m for m in HEAVY_MODULES if m in sys.modules]}))
+'''
+
+def measure(fn, iterations=200, warmup=10, alloc_iterations=20):
+    """
+    Time repeated calls of fn.
+
+    Args:
+        fn (callable): Stage to run, called without arguments
+        iterations (int): Timed calls
+        warmup (int): Untimed calls first (caches, lazy setup)
+        alloc_iterations (int): Calls traced for allocations
+    Returns:
+        dict: p50_ms, p99_ms, mean_ms, per_s and alloc_kB (median peak allocation per call)
+    """
+    for _ in range(warmup):
+        fn()
+    latencies = np.empty(iterations)
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn()
+        latencies[i] = time.perf_counter() - start
+
+    tracemalloc.start()
+    peaks = []
+    for _ in range(alloc_iterations):
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        fn()
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+
+    return {
+        'p50_ms': float(np.percentile(latencies, 50) * 1e3),
+        'p99_ms': float(np.percentile(latencies, 99) * 1e3),
+        'mean_ms': float(np.mean(latencies) * 1e3),
+        'per_s': float(iterations / np.sum(latencies)),
+        'alloc_kB': float(np.median(peaks) / 1024),
+    }
+
+def _stations(n, spacing=10.0):
+    """n station positions on a square grid"""
+    side = int(np.ceil(np.sqrt(n)))
+    xs, ys = np.meshgrid(np.arange(side) * spacing, np.arange(side) * spacing)
+    return np.column_stack([xs.ravel(), ys.ravel()])[:n]
+
+def _scenario(n_stations, seed=0):
+    """One drone crossing a grid of stations"""
+    stations = _stations(n_stations)
+    center = stations.mean(axis=0)
+    return Simulator(stations, drone_positions=[[center[0] - 5, center[1] + 3, 10]],
+                     drone_velocities=[[5, 1, 0]], fundamentals=[620], seed=seed)
+
+def audio_stages(iterations):
+    """process_audio_data, get_range_peak, reference matching and range estimation on one simulated frame"""
+    processor = AudioProcessor()
+    sim = _scenario(1)
+    frame = sim.block(0.0, processor.buffer_size)[0].astype(float)
+    freqs, fft_mag, fft_data = processor.process_audio_data(frame)
+    fft_data = fft_data.copy()
+    magnitude = np.power(10, fft_mag / 20)
+    audio.best_peak = np.inf  # Keep get_range_peak from printing new best peaks
+
+    results = {
+        'process_audio_data': measure(lambda: processor.process_audio_data(frame), iterations),
+        'get_range_peak': measure(lambda: processor.get_range_peak(fft_data, freqs, processor.freq_min,
+                                                                   processor.freq_max), iterations),
+    }
+    if processor.reference is not None:
+        with contextlib.redirect_stdout(io.StringIO()):
+            df, _, freq_mask, _ = read_and_process_data('fft_amplitudes_1.csv')
+        results['match_signal_shape'] = measure(
+            lambda: match_signal_shape(magnitude, df, freq_mask, reference_distance=2), iterations)
+    if processor.template_bank is not None:
+        batch = np.tile(magnitude, (32, 1))
+        results['template_match'] = measure(lambda: processor.template_bank.match(magnitude), iterations)
+        results['template_match_32_frames'] = measure(lambda: processor.template_bank.match(batch), iterations)
+    if processor.range_estimator is not None:
+        results['range_estimate'] = measure(lambda: processor.range_estimator.estimate(fft_mag), iterations)
+    return results
+
+def localization_stages(iterations):
+    """triangulate_target on four range circles and get_drone on eight Doppler observations"""
+    sim = _scenario(8, seed=1)
+    target = sim.positions(0.0)[0]
+    circles = [(tuple(s[:2]), float(np.linalg.norm(s - target))) for s in sim.stations[:4]]
+    observed = sim.observed_frequencies(0.0)[:, 0]
+    stations = sim.stations[:, :2]
+
+    def drone():
+        with contextlib.redirect_stdout(io.StringIO()):  # get_drone prints every solution
+            get_drone(observed, stations)
+
+    return {
+        'triangulate_target': measure(lambda: triangulate_target(circles), iterations),
+        'get_drone': measure(drone, max(10, iterations // 10)),
+    }
+
+def _sender_reports(sender, n):
+    """n consecutive reports of a sender fed with simulated audio"""
+    sim = _scenario(1, seed=2)
+    processor = sender.audio_processor
+    reports = []
+    for t, block in sim.stream(processor.hop_size):
+        processor.clock_anchor = (processor.ring.write_pos, 1000.0 + t)
+        processor.ring.push(block[0])
+        peak_freq, peak_power, target_power_dB = processor._update_stream(plot=False)
+        if peak_freq is not None:
+            reports.append(sender._report(1000.0 + t, peak_freq, peak_power, target_power_dB))
+            if len(reports) == n:
+                return reports
+
+def wire_stages(iterations):
+    """Report encoding and decoding (into the receiver's fusion queue) for JSON and binary messages"""
+    from ground import GroundStation
+    with contextlib.redirect_stdout(io.StringIO()):
+        sender = GroundStation('sender', name='bench')
+        receiver = GroundStation('receiver')
+    report = _sender_reports(sender, 1)[0]
+    report['sequence'] = 0
+    receiver._handle_message('bench', MSG_HELLO, decode_message(encode_hello(sender._station_metadata()))[1])
+
+    json_payload = json.dumps(report).encode('utf-8')
+    binary_payload = encode_reports([report])
+
+    def json_decode():
+        receiver._store_report('bench', json.loads(json_payload))
+
+    def binary_decode():
+        msg_type, body = decode_message(binary_payload)
+        receiver._handle_message('bench', msg_type, body)
+
+    return {
+        'json_encode': measure(lambda: json.dumps(report).encode('utf-8'), iterations),
+        'json_decode': measure(json_decode, iterations),
+        'binary_encode': measure(lambda: encode_reports([report]), iterations),
+        'binary_decode': measure(binary_decode, iterations),
+    }
+
+def fusion_stage(n_stations, iterations):
+    """
+    One fusion epoch at the receiver: decode a binary report from every station, queue it and fuse.
+
+    Target powers follow the inverse-square model that _audio_calcs inverts and peak
+    frequencies carry each station's Doppler shift.
+    """
+    from ground import GroundStation
+    with contextlib.redirect_stdout(io.StringIO()):
+        receiver = GroundStation('receiver')
+    sim = _scenario(n_stations, seed=3)
+    target = sim.positions(0.0)[0]
+    distances = np.linalg.norm(sim.stations - target, axis=1)
+    observed = sim.observed_frequencies(0.0)[:, 0]
+
+    payloads = []
+    for m, (location, distance, freq) in enumerate(zip(sim.stations[:, :2], distances, observed)):
+        station = f'sim{m}'
+        receiver._handle_message(station, MSG_HELLO, {'name': station, 'location': location.tolist()})
+        power_dB = 80.0 - 20 * np.log10(distance / 2.0)
+        payloads.append((station, {'timestamp': 0.0, 'capture_time': 0.0, 'peak_freq': freq, 'peak_power': power_dB,
+                                   'target_power_dB': power_dB, 'fundamental': freq, 'snr_dB': 30.0,
+                                   'confidence': 1.0, 'detected': True}))
+
+    epoch = [0]
+    def fuse():
+        capture_time = epoch[0] * receiver.fusion.epoch
+        for station, report in payloads:
+            report['capture_time'] = capture_time
+            msg_type, body = decode_message(encode_reports([report]))
+            receiver._handle_message(station, msg_type, body)
+        receiver._fuse_due(capture_time + receiver.fusion.epoch + receiver.fusion.deadline)
+        epoch[0] += 1
+
+    result = measure(fuse, iterations)
+    result['reports_per_s'] = result['per_s'] * n_stations
+    return result
+
+def cold_start(runs=5):
+    """
+    Start-up of a headless sender in fresh interpreters: import ground and build a GroundStation.
+
+    Returns:
+        dict: Latencies as measure(), alloc_kB as the largest peak RSS, and heavy_modules that got imported
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    code = f"HEAVY_MODULES = {HEAVY_MODULES!r}" + _COLD_START
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True, check=True)
+        samples.append(json.loads(output.stdout.strip().splitlines()[-1]))
+    seconds = np.array([sample['seconds'] for sample in samples])
+    return {
+        'p50_ms': float(np.percentile(seconds, 50) * 1e3),
+        'p99_ms': float(np.percentile(seconds, 99) * 1e3),
+        'mean_ms': float(np.mean(seconds) * 1e3),
+        'per_s': float(1 / np.mean(seconds)),
+        'alloc_kB': float(max(sample['max_rss_kB'] for sample in samples)),
+        'heavy_modules': sorted({m for sample in samples for m in sample['heavy_modules']}),
+    }
+
+def run(iterations=200, station_counts=(1, 10, 100)):
+    """
+    Run every stage.
+
+    Returns:
+        dict: {'environment': ..., 'stages': {stage name: measure() result}}
+    """
+    stages = {'cold_start_sender': cold_start()}
+    stages.update(audio_stages(iterations))
+    stages.update(localization_stages(iterations))
+    stages.update(wire_stages(iterations))
+    for n in station_counts:
+        stages[f'fusion_{n}_stations'] = fusion_stage(n, max(10, iterations // max(1, n // 10)))
+    return {
+        'version': FORMAT_VERSION,
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'stages': stages,
+    }
+
+def compare(results, baseline, tolerance=0.2):
+    """
+    Stages whose p50 latency is more than `tolerance` (fraction) above the baseline.
+
+    Returns:
+        list: (stage, baseline p50 ms, current p50 ms) per regression
+    """
+    regressions = []
+    for name, current in results['stages'].items():
+        previous = baseline['stages'].get(name)
+        if previous is not None and current['p50_ms'] > previous['p50_ms'] * (1 + tolerance):
+            regressions.append((name, previous['p50_ms'], current['p50_ms']))
+    return regressions
+
+def print_results(results, baseline=None):
+    print(f"{'stage':24} {'p50 ms':>10} {'p99 ms':>10} {'calls/s':>10} {'alloc kB':>10} {'vs base':>8}")
+    for name, r in results['stages'].items():
+        previous = baseline['stages'].get(name) if baseline else None
+        change = f"{r['p50_ms'] / previous['p50_ms']:7.2f}x" if previous else ''
+        print(f"{name:24} {r['p50_ms']:10.4f} {r['p99_ms']:10.4f} {r['per_s']:10.1f} {r['alloc_kB']:10.1f} {change:>8}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the detection and fusion pipeline")
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--stations', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--save', help="Write the results to this JSON file")
+    parser.add_argument('--compare', help="Baseline JSON to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed p50 slowdown as a fraction")
+    parser.add_argument('--cold-start-target', type=float, default=COLD_START_TARGET_MS,
+                        help="Headless sender start-up limit in ms")
+    args = parser.parse_args()
+
+    results = run(args.iterations, args.stations)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved results to {args.save}")
+    failed = False
+    start_up = results['stages']['cold_start_sender']
+    if start_up['heavy_modules']:
+        print(f"Headless sender imported {', '.join(start_up['heavy_modules'])}")
+        failed = True
+    if start_up['p50_ms'] > args.cold_start_target:
+        print(f"Cold start {start_up['p50_ms']:.0f} ms is over the {args.cold_start_target:.0f} ms target")
+        failed = True
+    if baseline:
+        regressions = compare(results, baseline, args.tolerance)
+        for name, before, after in regressions:
+            print(f"Regression: {name} p50 {before:.4f} ms -> {after:.4f} ms")
+        failed = failed or bool(regressions)
+    sys.exit(1 if failed else 0)
@@ -1,53 +1,87 @@
 import numpy as np
 import numpy.linalg
 import scipy
-# Plot 3D drone location and velocity vector
-import matplotlib.pyplot as plt
 from scipy.optimize import least_squares
+from collections import deque
 
-def get_drone(observed_freq, ground_stations):
+SPEED_OF_SOUND = 343  # m/s
+
+def doppler_residuals(params, f_ratios, mic_positions, ref_positions, dt=None, c=SPEED_OF_SOUND):
+    """
+    Vectorized Doppler ratio residuals and their analytic Jacobian.
+
+    For each microphone i the predicted ratio f_i / f_ref is (c + v.u_ref) / (c + v.u_i), where
+    u_i is the unit vector from microphone i to the drone, so the unknown source frequency cancels.
+
+    Args:
+        params (array-like): Drone state (x, y, h, v_x, v_y, v_h) at the reference time
+        f_ratios (ndarray): [m] observed f_i / f_ref for every non-reference microphone
+        mic_positions (ndarray): [m, 2+] position of each residual's microphone (only x, y are used)
+        ref_positions (ndarray): [m, 2+] position of each residual's reference microphone
+        dt (ndarray): Optional [m] time of each observation relative to the reference time;
+                      the drone is propagated with constant velocity
+    Returns:
+        tuple: (residuals [m], Jacobian [m, 6])
+    """
+    params = np.asarray(params, dtype=float)
+    position, velocity = params[:3], params[3:]
+    mics = np.asarray(mic_positions, dtype=float)[:, :2]
+    refs = np.asarray(ref_positions, dtype=float)[:, :2]
+
+    if dt is None:
+        dt = np.zeros(len(f_ratios))
+    # Drone position at each observation time
+    drone = position + dt[:, None] * velocity
+
+    def line_of_sight(mic_xy):
+        d = drone - np.column_stack([mic_xy, np.zeros(len(mic_xy))])
+        r = np.sqrt(np.sum(d**2, axis=1))
+        u = d / r[:, None]
+        v_dot_u = u @ velocity
+        # d(v.u)/d(drone position) = (v - (v.u) u) / r
+        d_pos = (velocity - v_dot_u[:, None] * u) / r[:, None]
+        return c + v_dot_u, d_pos, u
+
+    g_i, dpos_i, u_i = line_of_sight(mics)
+    g_0, dpos_0, u_0 = line_of_sight(refs)
+    ratio = g_0 / g_i
+    residuals = ratio - f_ratios
+
+    # Chain rule: drone = position + dt * velocity
+    dg_i = np.hstack([dpos_i, u_i + dpos_i * dt[:, None]])
+    dg_0 = np.hstack([dpos_0, u_0 + dpos_0 * dt[:, None]])
+    jacobian = (dg_0 * g_i[:, None] - g_0[:, None] * dg_i) / (g_i**2)[:, None]
+    return residuals, jacobian
+
+def _ratio_observations(observed_freq, mic_positions):
+    """Split one frame of observed frequencies into ratios against the first microphone"""
+    frequencies = np.asarray(observed_freq, dtype=float)
+    mic_positions = np.asarray(mic_positions, dtype=float)
+    f_ratios = frequencies[1:] / frequencies[0]
+    return f_ratios, mic_positions[1:], mic_positions[0]
+
+def get_drone(observed_freq, ground_stations, initial_guess=None):
 
-    # Constants
-    c = 343  # Speed of sound (m/s)
-    
     # Inputs
     frequencies = observed_freq  # Observed frequencies at microphones (Hz)
     mic_positions = ground_stations  # Microphone positions (x, y)
     
-    # Normalize frequencies to remove f_s
-    f_ratios = [frequencies[i] / frequencies[0] for i in range(1, len(frequencies))]
-    
-    # Define the residual function
+    # Normalize frequencies to remove f_s (every microphone is compared to the first one)
+    f_ratios, mics, reference = _ratio_observations(frequencies, mic_positions)
+    refs = np.broadcast_to(reference, mics.shape)
+
     def residuals(params):
-        x_d, y_d, h, v_x, v_y, v_h = params
-        res = []
-        
-        for i in range(1, len(mic_positions)-1):
-            # Positions
-            x_i, y_i, z_i = mic_positions[i]
-            x_j, y_j, z_j = mic_positions[0]
-            
-            # Distances
-            r_i = np.sqrt((x_d - x_i)**2 + (y_d - y_i)**2 + h**2)
-            r_j = np.sqrt((x_d - x_j)**2 + (y_d - y_j)**2 + h**2)
-            
-            # Relative velocities
-            v_par_i = -(v_x * (x_d - x_i) + v_y * (y_d - y_i) + v_h * h) / r_i
-            v_par_j = -(v_x * (x_d - x_j) + v_y * (y_d - y_j) + v_h * h) / r_j
-            
-            # Doppler shift ratios
-            doppler_ratio = (c - v_par_j) / (c - v_par_i)
-    
-            # Residual: difference between calculated and observed ratios
-            res.append(doppler_ratio - f_ratios[i - 1])
-        
-        return res
+        return doppler_residuals(params, f_ratios, mics, refs)[0]
+
+    def jacobian(params):
+        return doppler_residuals(params, f_ratios, mics, refs)[1]
     
     # Initial guesses for optimization
-    initial_guess = [0.5, 0.5, 1.0, 0.0, 0.0, 0.0]
+    if initial_guess is None:
+        initial_guess = [0.5, 0.5, 1.0, 0.0, 0.0, 0.0]
     
     # Solve the system of equations
-    result = least_squares(residuals, initial_guess)
+    result = least_squares(residuals, initial_guess, jac=jacobian)
     
     # Output the results
     x_d, y_d, h, v_x, v_y, v_h = result.x
@@ -55,6 +89,78 @@ def get_drone(observed_freq, ground_stations):
     print(f"Drone velocity: ({v_x:.2f}, {v_y:.2f}, {v_h:.2f})")
     return result.x
 
+class DopplerTracker:
+    """
+    Warm-started Doppler state estimator for continuous tracking.
+
+    Keeps a rolling window of frames and solves for the drone state at the newest
+    frame, assuming constant velocity across the window. Each update starts from the
+    previous solution (propagated to the new time), so only a few iterations are needed.
+    """
+    def __init__(self, window=5, initial_guess=(0.5, 0.5, 1.0, 0.0, 0.0, 0.0), max_nfev=20, c=SPEED_OF_SOUND):
+        """
+        Args:
+            window (int): Number of most recent frames solved jointly
+            initial_guess (tuple): State (x, y, h, v_x, v_y, v_h) used before the first solve
+            max_nfev (int): Solver evaluation budget per update
+            c (float): Speed of sound in m/s
+        """
+        self.frames = deque(maxlen=window)
+        self.initial_guess = np.array(initial_guess, dtype=float)
+        self.max_nfev = max_nfev
+        self.c = c
+        self.state = None
+        self.timestamp = None
+
+    def reset(self):
+        """Forget the window and the previous solution"""
+        self.frames.clear()
+        self.state = None
+        self.timestamp = None
+
+    def update(self, observed_freq, mic_positions, timestamp=0.0):
+        """
+        Add a frame of observed frequencies and re-solve.
+
+        Args:
+            observed_freq (array-like): [m] observed peak frequency at each microphone
+            mic_positions (array-like): [m, 2+] microphone positions for this frame
+            timestamp (float): Frame time in seconds
+        Returns:
+            ndarray: State (x, y, h, v_x, v_y, v_h) at `timestamp`
+        """
+        if len(observed_freq) < 2:
+            return self.state
+        f_ratios, mics, reference = _ratio_observations(observed_freq, mic_positions)
+        refs = np.broadcast_to(reference[:2], (len(mics), 2))
+        self.frames.append((timestamp, f_ratios, mics[:, :2], refs))
+
+        # Stack the window: each frame contributes its ratios against its own reference microphone
+        f_ratios = np.concatenate([f[1] for f in self.frames])
+        mics = np.vstack([f[2] for f in self.frames])
+        refs = np.vstack([f[3] for f in self.frames])
+        dt = np.concatenate([np.full(len(f[1]), f[0] - timestamp) for f in self.frames])
+
+        if self.state is None:
+            x0 = self.initial_guess.copy()
+        else:
+            # Warm start: propagate the previous solution to the new frame time
+            x0 = self.state.copy()
+            x0[:3] += x0[3:] * (timestamp - self.timestamp)
+        x0[2] = max(x0[2], 1e-3)
+
+        def residuals(params):
+            return doppler_residuals(params, f_ratios, mics, refs, dt, self.c)[0]
+
+        def jacobian(params):
+            return doppler_residuals(params, f_ratios, mics, refs, dt, self.c)[1]
+
+        lower = [-np.inf, -np.inf, 0.0, -np.inf, -np.inf, -np.inf]
+        result = least_squares(residuals, x0, jac=jacobian, bounds=(lower, np.inf), max_nfev=self.max_nfev)
+        self.state = result.x
+        self.timestamp = timestamp
+        return self.state
+
 def doppler_shift(drone_position, drone_velocity, microphone_positions, source_frequency):
     '''spoofs fake dopper shift data'''
     c = 343  # Speed of sound (m/s)
@@ -1,9 +1,26 @@
-import pandas as pd
-import matplotlib.pyplot as plt
+import os
+import sys
+import hashlib
+import zipfile
 import numpy as np
+from functools import lru_cache
+
+# Compiled reference spectra (written by compile_reference). Caches live in
+# REFERENCE_CACHE_DIR, not next to the CSV, so loading never writes into the source tree.
+# An uncompressed .npz holding:
+#   version        REFERENCE_FORMAT_VERSION
+#   source_sha256  SHA-256 of the CSV it was compiled from, with source_size / source_mtime_ns
+#   distances      [n_distances] float64, meters
+#   frequencies    [n_bins] float64, Hz
+#   spectra        [n_distances, n_bins] float32 FFT amplitudes
+# Members are stored, not deflated, so the spectra matrix is memory-mapped in place.
+REFERENCE_FORMAT_VERSION = 1
+REFERENCE_CACHE_DIR = os.environ.get('REFERENCE_CACHE_DIR', os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'drone-reference-spectra'))
 
 def read_and_process_data(file_path, max_freq=10000):
     """Read CSV and process frequency data"""
+    import pandas as pd
     df = pd.read_csv(file_path)
     print(f"DataFrame shape: {df.shape}")
     frequencies = [float(col.replace(' Hz', '')) for col in df.columns[1:]]
@@ -14,16 +31,156 @@ def read_and_process_data(file_path, max_freq=10000):
     
     return df, frequencies, freq_mask, filtered_frequencies
 
+def load_reference_spectra(file_path='fft_amplitudes_1.csv'):
+    """
+    Distance-labelled reference spectra as NumPy arrays, without pandas.
+
+    A CSV source is read through its compiled cache (see reference_cache_path), which is
+    (re)built when missing, from another format version, or compiled from a CSV with a
+    different hash. If the cache cannot be written the CSV is parsed directly. An .npz path,
+    or a CSV path whose CSV is gone but whose cache exists, loads the cache alone. Results
+    are cached per path and modification time, so every AudioProcessor shares one copy.
+
+    Returns:
+        tuple: (distances [n], frequencies [n_bins], spectra [n, n_bins] float32) read-only arrays
+    """
+    path = os.path.abspath(file_path)
+    cache_path = path if path.endswith('.npz') else reference_cache_path(path)
+    if not os.path.exists(path) and path != cache_path and os.path.exists(cache_path):
+        path = cache_path
+    return _load_reference(path, cache_path, os.stat(path).st_mtime_ns)
+
+def reference_cache_path(csv_path):
+    """Compiled cache of a reference CSV: REFERENCE_CACHE_DIR/<name>-<hash of its absolute path>.npz"""
+    csv_path = os.path.abspath(csv_path)
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    key = hashlib.sha256(csv_path.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(REFERENCE_CACHE_DIR, f"{name}-{key}.npz")
+
+@lru_cache(maxsize=8)
+def _load_reference(path, cache_path, mtime_ns):
+    if path == cache_path:
+        return _read_reference_cache(cache_path)
+    if os.path.exists(cache_path):
+        try:
+            cached = _read_reference_cache(cache_path, source=path)
+            if cached is not None:
+                return cached
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning: Ignoring unreadable reference cache {cache_path}: {e}")
+    try:
+        compile_reference(path, cache_path)
+    except OSError as e:
+        print(f"Warning: Could not write reference cache {cache_path} ({e}); parsing {path}")
+        return _read_only(*_read_reference_csv(path))
+    return _read_reference_cache(cache_path)
+
+def _read_reference_csv(path):
+    """(distances, frequencies, spectra) parsed from a reference CSV"""
+    with open(path) as f:
+        header = f.readline().strip().split(',')
+        data = np.loadtxt(f, delimiter=',', ndmin=2)
+    frequencies = np.array([float(col.replace(' Hz', '')) for col in header[1:]])
+    return data[:, 0].copy(), frequencies, np.ascontiguousarray(data[:, 1:], dtype=np.float32)
+
+def _read_only(*arrays):
+    for array in arrays:
+        array.flags.writeable = False
+    return arrays
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def compile_reference(csv_path, cache_path=None):
+    """
+    Compile a reference CSV into the binary cache format (see REFERENCE_FORMAT_VERSION).
+
+    Args:
+        csv_path (str): Source CSV ('Distance' column, then one '<f> Hz' column per bin)
+        cache_path (str): Output .npz, defaults to reference_cache_path(csv_path)
+    Returns:
+        str: Path of the written cache
+    """
+    cache_path = cache_path or reference_cache_path(csv_path)
+    _write_reference_cache(cache_path, csv_path, _file_sha256(csv_path), *_read_reference_csv(csv_path))
+    return cache_path
+
+def _write_reference_cache(cache_path, source, source_sha256, distances, frequencies, spectra):
+    """Write a cache stamped with the source's current size and modification time"""
+    stat = os.stat(source)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    # Write next to the target and rename, so readers never see a partial file
+    partial = f"{cache_path}.{os.getpid()}.partial"
+    with open(partial, 'wb') as f:
+        np.savez(f, version=np.int64(REFERENCE_FORMAT_VERSION), source_sha256=np.array(source_sha256),
+                 source_size=np.int64(stat.st_size), source_mtime_ns=np.int64(stat.st_mtime_ns),
+                 distances=distances, frequencies=frequencies, spectra=spectra)
+    os.replace(partial, cache_path)
+
+def _read_reference_cache(cache_path, source=None):
+    """
+    Cached (distances, frequencies, spectra), or None if `source` was changed since it was compiled.
+
+    A source whose modification time changed but whose hash did not (touched, checked out again)
+    has the cache restamped, so later loads skip hashing it.
+    """
+    restamp = None
+    with np.load(cache_path, mmap_mode='r') as cache:
+        if int(cache['version']) != REFERENCE_FORMAT_VERSION:
+            return None
+        if source is not None:
+            stat = os.stat(source)
+            unchanged = (int(cache['source_size']) == stat.st_size
+                         and int(cache['source_mtime_ns']) == stat.st_mtime_ns)
+            if not unchanged:
+                source_sha256 = str(cache['source_sha256'])
+                if source_sha256 != _file_sha256(source):
+                    return None
+                restamp = (source_sha256, cache['spectra'])
+        distances = cache['distances']
+        frequencies = cache['frequencies']
+    if restamp is not None:
+        try:
+            _write_reference_cache(cache_path, source, restamp[0], distances, frequencies, restamp[1])
+        except OSError as e:
+            print(f"Warning: Could not update reference cache {cache_path}: {e}")
+    return _read_only(distances, frequencies, _memmap_npz_member(cache_path, 'spectra'))
+
+def _memmap_npz_member(path, name):
+    """
+    Memory-map an array stored uncompressed inside an .npz.
+
+    np.load cannot map .npz members, so the member's .npy header is located through the
+    zip directory and the data after it is mapped directly.
+    """
+    with zipfile.ZipFile(path) as archive:
+        info = archive.getinfo(name + '.npy')
+    if info.compress_type != zipfile.ZIP_STORED:
+        with np.load(path) as cache:
+            return cache[name]
+    with open(path, 'rb') as f:
+        # Local file header: 30 fixed bytes, then the file name and extra field
+        f.seek(info.header_offset + 26)
+        name_length, extra_length = np.frombuffer(f.read(4), dtype='<u2')
+        f.seek(info.header_offset + 30 + int(name_length) + int(extra_length))
+        version = np.lib.format.read_magic(f)
+        read_header = (np.lib.format.read_array_header_1_0 if version == (1, 0)
+                       else np.lib.format.read_array_header_2_0)
+        shape, fortran_order, dtype = read_header(f)
+        offset = f.tell()
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape, order='F' if fortran_order else 'C')
+
 def calculate_powers(df, freq_mask):
     """Calculate total power for each distance"""
-    powers = []
-    for _, row in df.iterrows():
-        power = np.sum(row[1:].values[freq_mask]**2)
-        powers.append(power)
-    return powers
+    return np.sum(df.iloc[:, 1:].values[:, np.asarray(freq_mask, dtype=bool)]**2, axis=1)
 
 def plot_fft_amplitudes(df, filtered_frequencies, freq_mask):
     """Create FFT amplitude plot"""
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(12, 6))
     for _, row in df.iterrows():
         distance = row['Distance']
@@ -39,6 +196,7 @@ def plot_fft_amplitudes(df, filtered_frequencies, freq_mask):
 
 def plot_power_distance(distances, powers):
     """Create power vs distance plot"""
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(12, 6))
     # Convert powers to dB
     powers_db = 20 * np.log10(powers)
@@ -95,8 +253,70 @@ def match_signal_shape(measured_fft, df, freq_mask, reference_distance=2):
     
     return matched_signal, correlation
 
+class TemplateBank:
+    """
+    Reference spectra resampled onto a live FFT bin grid and normalized once.
+
+    Every reference row (one per distance) is interpolated onto the live frequencies,
+    mean-centered and scaled to unit norm into a contiguous [n_templates, n_bins] array,
+    so the Pearson correlation of a measured spectrum with every template is a single
+    matrix-vector product (matrix-matrix for a batch of frames).
+    """
+    def __init__(self, distances, ref_frequencies, spectra, freqs):
+        """
+        Args:
+            distances (array-like): [n_templates] distance of each reference spectrum in meters
+            ref_frequencies (array-like): [n_ref_bins] frequencies of the reference spectra in Hz
+            spectra (array-like): [n_templates, n_ref_bins] reference FFT amplitudes
+            freqs (ndarray): [n_bins] live FFT bin frequencies to match on
+        """
+        self.distances = np.asarray(distances, dtype=float)
+        self.freqs = freqs
+        ref_frequencies = np.asarray(ref_frequencies, dtype=float)
+        spectra = np.asarray(spectra, dtype=float)
+
+        # Linear interpolation weights from the reference grid to the live grid, shared by all rows
+        hi = np.clip(np.searchsorted(ref_frequencies, freqs), 1, len(ref_frequencies) - 1)
+        lo = hi - 1
+        frac = np.clip((freqs - ref_frequencies[lo]) / (ref_frequencies[hi] - ref_frequencies[lo]), 0, 1)
+        self.spectra = np.ascontiguousarray(spectra[:, lo] * (1 - frac) + spectra[:, hi] * frac)
+
+        self.norms = np.linalg.norm(self.spectra, axis=1)
+        centered = self.spectra - self.spectra.mean(axis=1, keepdims=True)
+        self.templates = np.ascontiguousarray(centered / (np.linalg.norm(centered, axis=1, keepdims=True) + 1e-20))
+
+    def correlate(self, measured):
+        """
+        Correlation of measured spectra with every template.
+
+        Args:
+            measured (ndarray): [n_bins] or [n_frames, n_bins] FFT amplitudes on the bank's grid
+        Returns:
+            ndarray: [n_templates] or [n_frames, n_templates] Pearson correlations
+        """
+        centered = measured - measured.mean(axis=-1, keepdims=True)
+        centered = centered / (np.linalg.norm(centered, axis=-1, keepdims=True) + 1e-20)
+        return centered @ self.templates.T
+
+    def match(self, measured):
+        """
+        Best-matching template of each measured spectrum.
+
+        Returns:
+            tuple: (template index, correlation, template distance in meters), as arrays for a batch
+        """
+        correlations = self.correlate(measured)
+        best = np.argmax(correlations, axis=-1)
+        correlation = np.take_along_axis(correlations, np.expand_dims(best, -1), axis=-1)[..., 0]
+        return best, correlation, self.distances[best]
+
+    def matched_signal(self, measured, index):
+        """Template `index` scaled to the energy of a measured [n_bins] spectrum"""
+        return self.spectra[index] * (np.linalg.norm(measured) / (self.norms[index] + 1e-20))
+
 def plot_signal_comparison(measured_fft, matched_signal, filtered_frequencies, freq_mask):
     """Plot original and matched signals for comparison"""
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(12, 6))
     
     # Plot original measured signal
@@ -134,7 +354,13 @@ def main():
     
     # Plot comparison
     plot_signal_comparison(measured_fft, matched_signal, filtered_frequencies, freq_mask)
+    import matplotlib.pyplot as plt
     plt.show()
 
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 1:
+        # python filter.py <reference.csv> ...: compile reference spectra to their binary cache
+        for csv_path in sys.argv[1:]:
+            print(f"Compiled {csv_path} -> {compile_reference(csv_path)}")
+    else:
+        main()
@@ -0,0 +1,60 @@
+import numpy as np
+from threading import Lock
+
+class FusionScheduler:
+    """
+    Groups station reports into fixed capture-time epochs and releases each epoch on a deadline.
+
+    A report goes into the epoch that contains its capture time (on the receiver's clock),
+    with the newest report per station kept. An epoch is released `deadline` seconds after it
+    ends with whatever stations reported, so one slow station delays fusion by at most the
+    deadline instead of blocking it. Reports for epochs that were already released are dropped.
+    add() and due() may be called from different threads.
+    """
+    def __init__(self, epoch=0.2, deadline=0.3):
+        """
+        Args:
+            epoch (float): Epoch length in seconds
+            deadline (float): Wait after an epoch ends before it is fused, in seconds
+        """
+        if epoch <= 0 or deadline < 0:
+            raise ValueError("epoch must be positive and deadline non-negative")
+        self.epoch = epoch
+        self.deadline = deadline
+        self.pending = {}       # {epoch index: {station: report}}
+        self.last_fired = None  # Index of the newest released epoch
+        self.late_reports = 0
+        self._lock = Lock()
+
+    def add(self, station, capture_time, report):
+        """
+        Queue a report for fusion.
+
+        Returns:
+            bool: False if the report's epoch was already released (the report is dropped)
+        """
+        index = int(np.floor(capture_time / self.epoch))
+        with self._lock:
+            if self.last_fired is not None and index <= self.last_fired:
+                self.late_reports += 1
+                return False
+            self.pending.setdefault(index, {})[station] = report
+        return True
+
+    def due(self, now):
+        """
+        Release every epoch whose deadline has passed, oldest first.
+
+        Args:
+            now (float): Current time on the receiver's clock
+        Returns:
+            list: (epoch mid-time, {station: report}) per released epoch
+        """
+        ready = []
+        with self._lock:
+            for index in sorted(self.pending):
+                if (index + 1) * self.epoch + self.deadline > now:
+                    break
+                ready.append(((index + 0.5) * self.epoch, self.pending.pop(index)))
+                self.last_fired = index
+        return ready
@@ -1,19 +1,33 @@
 import socket
+import struct
+import random
+import asyncio
 import json
 import time
+import base64
+import numpy as np
+from collections import deque
 from audio import AudioProcessor
 from utilities import calculate_distance
-from triangulate import triangulate_target
+from triangulate import solve_circles
+from tracker import KalmanTracker, IMMTracker
+from tdoa import spectral_snapshot, tdoa_localize
+from association import associate_peaks, MultiTargetTracker
+from protocol import (encode_hello, encode_reports, decode_message, is_binary, header_station_id,
+                      encode_ping, encode_pong, encode_heartbeat, clock_offset,
+                      MSG_HELLO, MSG_REPORTS, MSG_PING, MSG_PONG, MSG_HEARTBEAT,
+                      SPECTRUM_CODECS, MAX_DATAGRAM)
+from fusion import FusionScheduler
+from recording import Recorder
 from threading import Thread
 from typing import Optional, Dict, Tuple
 import sounddevice as sd
-import matplotlib.pyplot as plt
-from matplotlib.patches import Circle
-import matplotlib.animation as animation
-from multiprocessing import Process
 
 class GroundStation:
-    def __init__(self, station_type: str, host: str = '0.0.0.0', port: int = 58392, location=(0,0), plot_enabled=False, name="default", low_cutoff_Hz = 500, thresh_dB = 30, target_filter_alpha = 0.1):
+    def __init__(self, station_type: str, host: str = '0.0.0.0', port: int = 58392, location=(0,0), plot_enabled=False, name="default", low_cutoff_Hz = 500, thresh_dB = 30, channels=1, localization='amplitude', tracker='cv', process_noise=1.0, max_targets=1,
+                 protocol='binary', report_batch=1, spectrum_codec='complex64', transport='tcp', multicast_group=None,
+                 fusion_epoch=0.2, fusion_deadline=0.3, gating=False, heartbeat_interval=1.0, gate_power_tolerance_dB=6.0,
+                 record_path=None, spectral_ranging=True, temperature=20.0, humidity=50.0):
         """
         Initialize a ground station that can act as either sender or receiver
         
@@ -24,27 +38,100 @@ class GroundStation:
             location (tuple): (x, y) coordinates of the station
             plot_enabled (bool): Whether to enable real-time plotting
             name (str): Name of the ground station
-            target_filter_alpha (float): Low-pass filter coefficient (0-1). Lower values = more filtering
+            channels (int): Number of microphone channels to capture
+            localization (str): 'amplitude' (inverse-square ranges) or 'tdoa' (GCC-PHAT time differences,
+                                needs synchronized station clocks)
+            tracker (str): Target tracker, 'cv' (constant-velocity Kalman) or 'imm' (constant velocity + turns)
+            process_noise (float): Tracker acceleration noise (m^2/s^3); higher follows maneuvers faster
+            max_targets (int): Drones tracked simultaneously; above 1 stations report their top peaks and the
+                               receiver associates them by frequency into one track per drone
+            protocol (str): Sender wire format, 'binary' (see protocol.py) or 'json' (legacy); receivers accept both
+            report_batch (int): Reports packed into one binary message (more saves overhead, adds latency)
+            spectrum_codec (str): TDOA snapshot encoding in binary messages, 'complex64' or 'float16' (half size)
+            transport (str): Detection report transport, 'tcp' or 'udp'. With 'udp' reports are sent as datagrams
+                             (binary protocol only) and TCP only carries the hello; the receiver drops late or
+                             duplicate reports by sequence number and keeps per-station loss statistics
+            multicast_group (str): Multicast address for UDP reports (None = unicast to host)
+            fusion_epoch (float): Receiver fuses reports in capture-time epochs of this many seconds
+            fusion_deadline (float): Seconds after an epoch ends that the receiver waits for stragglers
+            gating (bool): Sender only sends full reports while it detects a drone (harmonic detection with
+                           target power above thresh_dB), when detection ends, or when the quiet-time power
+                           changes by more than gate_power_tolerance_dB; otherwise it sends heartbeats
+            heartbeat_interval (float): Seconds between heartbeats of a gated sender
+            gate_power_tolerance_dB (float): Target power change that triggers a report while quiet
+            record_path (str): Record local audio and (on a receiver) every received message to this log
+                               for replay with recording.replay_audio / replay_messages
+            spectral_ranging (bool): Receiver uses the senders' spectral range estimates (fit of the live
+                                     spectrum against the distance-labelled reference spectra, see ranging.py)
+                                     when they have one, instead of inverse-square ranges from target power
+            temperature (float): Air temperature in deg C at the station (atmospheric absorption)
+            humidity (float): Relative humidity in % at the station; senders announce their weather in
+                              the hello and the receiver keeps it per station (see _station_absorption)
         """
         if station_type not in ['sender', 'receiver']:
             raise ValueError("station_type must be either 'sender' or 'receiver'")
+        if localization not in ['amplitude', 'tdoa']:
+            raise ValueError("localization must be either 'amplitude' or 'tdoa'")
+        if tracker not in ['cv', 'imm']:
+            raise ValueError("tracker must be either 'cv' or 'imm'")
+        if protocol not in ['binary', 'json']:
+            raise ValueError("protocol must be either 'binary' or 'json'")
+        if spectrum_codec not in SPECTRUM_CODECS:
+            raise ValueError(f"spectrum_codec must be one of {list(SPECTRUM_CODECS)}")
+        if transport not in ['tcp', 'udp']:
+            raise ValueError("transport must be either 'tcp' or 'udp'")
+        if transport == 'udp' and protocol != 'binary':
+            raise ValueError("UDP transport requires the binary protocol")
             
         self.station_type = station_type
         self.host = host
         self.port = port
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.audio_processor = AudioProcessor(freq_min=low_cutoff_Hz)
+        self.audio_processor = AudioProcessor(freq_min=low_cutoff_Hz, channels=channels, max_targets=max_targets,
+                                              temperature=temperature, humidity=humidity)
         self.running = False
         self.location = location
         self.name = name
         self.thresh_dB = thresh_dB
+        self.localization = localization
+        self.max_targets = max_targets
+        self.protocol = protocol
+        self.report_batch = report_batch
+        self.spectrum_codec = spectrum_codec
+        self.transport = transport
+        self.multicast_group = multicast_group
+        self.station_id = random.getrandbits(32) or 1  # Identifies this sender's datagrams
+        self.udp_socket = None
+        self._sequence = 0
+        self.gating = gating
+        self.heartbeat_interval = heartbeat_interval
+        self.gate_power_tolerance_dB = gate_power_tolerance_dB
+        self._last_full_report = None  # (active, target_power_dB) of the last full report sent
+        self._last_send_time = 0.0
+        self.recorder = Recorder(record_path) if record_path else None
+        self.audio_processor.recorder = self.recorder
+        # Sender clock correction: receiver clock minus local clock, from NTP-style pings
+        self.clock_offset = 0.0
+        self.clock_sync_interval = 10.0
+        self._clock_samples = deque(maxlen=8)
         # For receiver to track multiple sender connections
-        self.clients: Dict[str, socket.socket] = {}
-        self.sender_data: Dict[str, Tuple[float, float]] = {}  # {client_addr: (peak_freq, peak_power)}
-        
-        # Set the backend before importing pyplot
-        import matplotlib
-        matplotlib.use('Qt5Agg')  # Change from TkAgg to Qt5Agg
+        self.clients: Dict[str, asyncio.StreamWriter] = {}
+        self.listen_backlog = 128
+        self.max_message_size = 1 << 20  # Larger length prefixes are treated as a corrupt stream
+        self._client_tasks = set()
+        # Reports wait here, bucketed by capture time, until their epoch is fused
+        self.fusion = FusionScheduler(fusion_epoch, fusion_deadline)
+        # Epoch being fused: {client_addr: (peak_freq, peak_power, location, name, target_power_dB, snr_dB, detected, peaks,
+        #                                  target_range, range_uncertainty)}
+        self.sender_data: Dict[str, Tuple] = {}
+        # {client_addr: hello metadata} of binary-protocol senders, including their weather
+        self.station_info: Dict[str, dict] = {}
+        # {station_id: client_addr} for matching datagrams to their control connection
+        self.udp_stations: Dict[int, str] = {}
+        # {client_addr: {'received', 'lost', 'late', 'last_sequence'}} for UDP reports
+        self.link_stats: Dict[str, dict] = {}
+        # {client_addr: (capture_time, start_bin, n_fft, band spectrum)} for TDOA localization
+        self.snapshots: Dict[str, Tuple] = {}
 
         # Initialize data dictionary with empty lists
         self.data = {
@@ -54,6 +141,7 @@ class GroundStation:
             'gnd_location': [],
             'target_distance': [],
             'target_location': None,
+            'targets': [],
             'target_power_dB': [],
             'station_names': []
         }
@@ -67,6 +155,11 @@ class GroundStation:
         # Add plotting flag
         self.plot_enabled = plot_enabled
         if self.plot_enabled:
+            # Only plotting stations load matplotlib and Qt; headless senders never import them.
+            # The backend has to be set before pyplot is imported
+            import matplotlib
+            matplotlib.use('Qt5Agg')  # Change from TkAgg to Qt5Agg
+            import matplotlib.animation as animation
             self._setup_plot()
             # Set up animation
             self.anim = animation.FuncAnimation(
@@ -77,8 +170,15 @@ class GroundStation:
                 save_count=100  # Limit frame cache to 100 frames
             )
 
-        self.target_filter_alpha = target_filter_alpha
-        self.filtered_target = (0, 0)  # Initialize as tuple instead of int
+        # Track the target between fixes; the first fix starts the track
+        if tracker == 'imm':
+            self.tracker = IMMTracker(process_noise=process_noise)
+        else:
+            self.tracker = KalmanTracker(process_noise=process_noise)
+        self.min_fix_variance = 0.25  # m^2 floor on fix covariance so no fix is treated as exact
+        self.spectral_ranging = spectral_ranging
+        self.amplitude_range_error = 0.3  # Relative one-sigma error assumed for inverse-square ranges
+        self.multi_tracker = MultiTargetTracker(process_noise=process_noise, max_targets=max_targets)
         
     def start(self):
         """Start the ground station operations"""
@@ -96,6 +196,7 @@ class GroundStation:
             
         # Run matplotlib in the main thread
         if self.plot_enabled:
+            import matplotlib.pyplot as plt
             plt.show(block=True)
         else:
             # If no plot, keep main thread alive
@@ -105,100 +206,251 @@ class GroundStation:
     def stop(self):
         """Stop the ground station operations"""
         self.running = False
+        if self.recorder is not None:
+            self.audio_processor.recorder = None
+            self.recorder.close()
+            self.recorder = None
+        # The receiver's event loop closes its client connections once it sees running is False
         self.socket.close()
-        for client in self.clients.values():
-            client.close()
 
     def _start_receiver(self):
         """Initialize and run the receiver station"""
-        self.socket.bind((self.host, self.port))
-        self.socket.listen(5)  # Allow up to 5 sender connections
-        print(f"Receiver listening on {self.host}:{self.port}")
-        
-        # Start audio processing thread
+        # Start audio processing thread; it also runs the fusion so the event loop only does I/O
         audio_thread = Thread(target=self._process_local_audio)
         audio_thread.daemon = True
         audio_thread.start()
-        
-        # Accept and handle client connections
-        while self.running:
-            try:
-                client_socket, address = self.socket.accept()
-                print(f"New connection from {address}")
-                self.clients[address[0]] = client_socket
-
-                # Start a new thread to handle this client
-                client_thread = Thread(target=self._handle_client, args=(client_socket, address[0]))
-                client_thread.daemon = True
-                client_thread.start()
-                
-            except Exception as e:
-                print(f"Receiver error: {e}")
 
-    def _handle_client(self, client_socket: socket.socket, client_addr: str):
+        # One event loop serves every sender connection
+        asyncio.run(self._serve())
+
+    async def _serve(self):
+        """Accept sender connections until the station is stopped"""
+        server = await asyncio.start_server(self._handle_client, self.host, self.port,
+                                            backlog=self.listen_backlog, limit=self.max_message_size)
+        print(f"Receiver listening on {self.host}:{self.port}")
+        datagrams = None
+        if self.transport == 'udp':
+            datagrams, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+                lambda: _ReportDatagrams(self), sock=self._udp_receiver_socket())
+            print(f"Receiving UDP reports on {self.multicast_group or self.host}:{self.port}")
+        async with server:
+            while self.running:
+                await asyncio.sleep(0.1)
+            server.close()
+            # Closing the transports ends each handler's pending read; wait for their cleanup
+            for writer in list(self.clients.values()):
+                writer.close()
+            await asyncio.gather(*self._client_tasks, return_exceptions=True)
+            if datagrams is not None:
+                datagrams.close()
+
+    def _udp_receiver_socket(self):
+        """UDP socket bound to the report port, joined to the multicast group if one is set"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+        if self.multicast_group:
+            sock.bind(('', self.port))
+            interface = socket.inet_aton('0.0.0.0' if self.host in ('', '0.0.0.0') else self.host)
+            membership = struct.pack('4s4s', socket.inet_aton(self.multicast_group), interface)
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        else:
+            sock.bind((self.host, self.port))
+        sock.setblocking(False)
+        return sock
+
+    def _handle_datagram(self, data: bytes):
+        """Apply a UDP report message, dropping reports older than the newest one already received"""
+        if self.recorder is not None:
+            self.recorder.write_message(time.time(), 'udp', data)
+        client_addr = self.udp_stations.get(header_station_id(data))
+        if client_addr is None:
+            return  # Not in this protocol, or the station's hello has not arrived yet
+        msg_type, body = decode_message(data)
+        if msg_type == MSG_HEARTBEAT:
+            self._handle_message(client_addr, msg_type, body)
+        if msg_type != MSG_REPORTS:
+            return
+
+        records, peaks, spectra = body
+        stats = self.link_stats[client_addr]
+        fresh = []
+        for i, sequence in enumerate(records['sequence']):
+            sequence = int(sequence)
+            last = stats['last_sequence']
+            if last is not None and sequence <= last:
+                stats['late'] += 1  # Reordered or duplicated; a newer report was already used
+                continue
+            if last is not None:
+                stats['lost'] += sequence - last - 1
+            stats['last_sequence'] = sequence
+            stats['received'] += 1
+            fresh.append(i)
+        if fresh:
+            self._handle_message(client_addr, MSG_REPORTS,
+                                 (records[fresh], [peaks[i] for i in fresh], [spectra[i] for i in fresh]))
+
+    def loss_stats(self):
+        """
+        UDP link statistics per station.
+
+        Returns:
+            dict: {station name: (received, lost, late, loss fraction)}
+        """
+        stats = {}
+        for client_addr, link in self.link_stats.items():
+            name = self.station_info.get(client_addr, {}).get('name', client_addr)
+            expected = link['received'] + link['lost']
+            stats[name] = (link['received'], link['lost'], link['late'], link['lost'] / expected if expected else 0.0)
+        return stats
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
         """Handle incoming data from a sender client"""
+        host, port = writer.get_extra_info('peername')[:2]
+        client_addr = f"{host}:{port}"
+        print(f"New connection from {client_addr}")
+        self.clients[client_addr] = writer
+        self._client_tasks.add(asyncio.current_task())
         # Set TCP keepalive
-        client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
-        # Set non-blocking mode
-        client_socket.setblocking(False)
-        
-        buffer = b""
-        while self.running:
-            try:
-                # First read the message length (4 bytes)
-                while len(buffer) < 4:
-                    try:
-                        chunk = client_socket.recv(4 - len(buffer))
-                        if not chunk:
-                            raise ConnectionError("Connection closed by client")
-                        buffer += chunk
-                    except BlockingIOError:
-                        time.sleep(0.01)
-                        continue
-                
-                msg_length = int.from_bytes(buffer[:4], byteorder='big')
-                buffer = buffer[4:]
-                
-                # Then read the actual message
-                while len(buffer) < msg_length:
-                    try:
-                        chunk = client_socket.recv(msg_length - len(buffer))
-                        if not chunk:
-                            raise ConnectionError("Connection closed by client")
-                        buffer += chunk
-                    except BlockingIOError:
-                        time.sleep(0.01)
-                        continue
-                
-                data = buffer[:msg_length]
-                buffer = buffer[msg_length:]
-                
-                received_data = json.loads(data.decode('utf-8'))
-                self.sender_data[client_addr] = (
-                    received_data['peak_freq'],
-                    received_data['peak_power'],
-                    received_data['location'],
-                    received_data.get('name', f'Station {client_addr}'),
-                    received_data['target_power_dB']
-                )
-                
-            except (BlockingIOError, socket.timeout):
-                # No data available right now
-                time.sleep(0.01)
-                continue
-            except ConnectionError as e:
-                print(f"Connection error with client {client_addr}: {e}")
-                break
-            except Exception as e:
-                print(f"Error handling client {client_addr}: {e}")
-                break
-                
+        writer.get_extra_info('socket').setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+        try:
+            while self.running:
+                # 4-byte big-endian length prefix, then the message. readexactly() suspends this
+                # client only, and unread data stays in the kernel buffer (TCP backpressure).
+                header = await reader.readexactly(4)
+                msg_length = int.from_bytes(header, byteorder='big')
+                if msg_length > self.max_message_size:
+                    raise ConnectionError(f"Message of {msg_length} bytes exceeds the limit")
+                data = await reader.readexactly(msg_length)
+                received = time.time()
+                if self.recorder is not None:
+                    self.recorder.write_message(received, client_addr, data)
+                if is_binary(data):
+                    msg_type, body = decode_message(data)
+                    if msg_type == MSG_PING:
+                        pong = encode_pong(body[0], received, time.time())
+                        writer.write(len(pong).to_bytes(4, byteorder='big') + pong)
+                    else:
+                        self._handle_message(client_addr, msg_type, body)
+                else:
+                    self._store_report(client_addr, json.loads(data))
+        except asyncio.IncompleteReadError:
+            print(f"Connection error with client {client_addr}: Connection closed by client")
+        except ConnectionError as e:
+            print(f"Connection error with client {client_addr}: {e}")
+        except Exception as e:
+            print(f"Error handling client {client_addr}: {e}")
+
         # Clean up when client disconnects
         print(f"Client {client_addr} disconnected")
-        del self.clients[client_addr]
-        if client_addr in self.sender_data:
-            del self.sender_data[client_addr]
-        client_socket.close()
+        self.clients.pop(client_addr, None)
+        info = self.station_info.pop(client_addr, None)
+        if info is not None and self.udp_stations.get(info.get('station_id')) == client_addr:
+            del self.udp_stations[info['station_id']]
+        self.link_stats.pop(client_addr, None)
+        self._client_tasks.discard(asyncio.current_task())
+        writer.close()
+
+    def _store_report(self, client_addr: str, received_data: dict):
+        """Queue a decoded JSON report for fusion"""
+        capture_time = received_data.get('capture_time', received_data.get('timestamp', time.time()))
+        if received_data.get('heartbeat'):
+            values = self._quiet_values(received_data['location'], received_data.get('name', f'Station {client_addr}'))
+            self.fusion.add(client_addr, capture_time, (values, None))
+            return
+        values = (
+            received_data['peak_freq'],
+            received_data['peak_power'],
+            received_data['location'],
+            received_data.get('name', f'Station {client_addr}'),
+            received_data['target_power_dB'],
+            received_data.get('snr_dB'),
+            received_data.get('detected', True),
+            received_data.get('peaks', []),
+            _float_or_nan(received_data.get('range')),
+            _float_or_nan(received_data.get('range_uncertainty'))
+        )
+        snapshot = None
+        if 'snapshot' in received_data:
+            snapshot = (
+                capture_time,
+                received_data['snapshot_start_bin'],
+                received_data['snapshot_nfft'],
+                np.frombuffer(base64.b64decode(received_data['snapshot']), dtype=np.complex64)
+            )
+        self.fusion.add(client_addr, capture_time, (values, snapshot))
+
+    def _handle_message(self, client_addr: str, msg_type: int, body):
+        """Apply a decoded binary-protocol message"""
+        if msg_type == MSG_HELLO:
+            self.station_info[client_addr] = body
+            if body.get('station_id'):
+                self.udp_stations[body['station_id']] = client_addr
+                self.link_stats[client_addr] = {'received': 0, 'lost': 0, 'late': 0, 'last_sequence': None}
+            return
+        info = self.station_info.get(client_addr)
+        if info is None:
+            raise ConnectionError("Reports received before hello")
+        if msg_type == MSG_HEARTBEAT:
+            values = self._quiet_values(info['location'], info.get('name', f'Station {client_addr}'))
+            self.fusion.add(client_addr, body[0], (values, None))
+            return
+        records, peaks, spectra = body
+        for record, record_peaks, spectrum in zip(records, peaks, spectra):
+            values = (
+                float(record['peak_freq']),
+                float(record['peak_power']),
+                info['location'],
+                info.get('name', f'Station {client_addr}'),
+                float(record['target_power_dB']),
+                float(record['snr_dB']),
+                bool(record['detected']),
+                record_peaks.tolist(),
+                float(record['range']),
+                float(record['range_uncertainty'])
+            )
+            capture_time = float(record['capture_time'])
+            if not np.isfinite(capture_time):
+                capture_time = float(record['timestamp'])
+            snapshot = None
+            if spectrum is not None:
+                snapshot = (capture_time, int(record['snapshot_start_bin']), int(record['snapshot_nfft']), spectrum)
+            self.fusion.add(client_addr, capture_time, (values, snapshot))
+
+    def update_weather(self, temperature, humidity):
+        """
+        Apply new weather to this station's absorption tables.
+
+        A connected binary-protocol sender re-sends its hello so the receiver picks the change up.
+        """
+        processor = self.audio_processor
+        if (temperature, humidity) == (processor.temperature, processor.humidity):
+            return
+        processor.set_weather(temperature, humidity)
+        if self.station_type == 'sender' and self.protocol == 'binary' and self.running:
+            try:
+                self._send_message(encode_hello(self._station_metadata()))
+            except OSError as e:
+                print(f"Could not announce new weather: {e}")
+
+    def _station_absorption(self, client_addr, freq):
+        """
+        Air absorption in dB/m at freq for the weather a station announced in its hello.
+
+        Stations without one (JSON senders, the receiver's own audio) use this station's weather.
+        """
+        processor = self.audio_processor
+        info = self.station_info.get(client_addr, {})
+        temperature, humidity = info.get('temperature'), info.get('humidity')
+        if temperature is None or humidity is None:
+            temperature, humidity = processor.temperature, processor.humidity
+        attenuation = processor.attenuation
+        return float(np.interp(freq, attenuation.frequencies, attenuation.absorption(temperature, humidity)))
+
+    def _quiet_values(self, location, name):
+        """Fusion entry of a station that sent a heartbeat: present, but no detection"""
+        return (np.nan, np.nan, location, name, -np.inf, np.nan, False, [], np.nan, np.nan)
 
     def _start_sender(self):
         """Initialize and run the sender station"""
@@ -213,66 +465,245 @@ class GroundStation:
                 print(f"Attempting to connect to receiver at {self.host}:{self.port}")
                 self.socket.connect((self.host, self.port))
                 print(f"Connected to receiver at {self.host}:{self.port}")
+                if self.transport == 'udp' and self.udp_socket is None:
+                    self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                    if self.multicast_group:
+                        self.udp_socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
                 
                 with sd.InputStream(callback=self.audio_processor.audio_callback, 
-                                  channels=1, 
+                                  channels=self.audio_processor.channels, 
                                   samplerate=self.audio_processor.sample_rate):
                     print("Streaming audio...")
+                    if self.protocol == 'binary':
+                        self._send_message(encode_hello(self._station_metadata()))
+                    self._sync_clock()
                     last_send_time = 0
+                    last_sync_time = time.time()
+                    pending = []
                     while self.running:
                         current_time = time.time()
+                        if current_time - last_sync_time >= self.clock_sync_interval:
+                            self._sync_clock()
+                            last_sync_time = current_time
                         # Increase minimum time between sends from 0.1s to 0.5s
                         if current_time - last_send_time >= 0.2:  # Changed from 0.1
                             peak_freq, peak_power, target_power_dB = self.audio_processor._update_stream(plot=False)
                             
                             if peak_freq is not None and peak_power is not None:
-                                data = {
-                                    "timestamp": current_time,
-                                    "peak_freq": peak_freq,
-                                    "peak_power": peak_power,
-                                    "location": self.location,
-                                    "name": self.name,
-                                    "target_power_dB": target_power_dB
-                                }
-                                
-                                try:
-                                    json_data = json.dumps(data).encode('utf-8')
-                                    # Add message length prefix
-                                    msg_length = len(json_data)
-                                    header = msg_length.to_bytes(4, byteorder='big')
-                                    self.socket.sendall(header + json_data)
-                                    last_send_time = current_time
-                                except BlockingIOError:
-                                    # Socket buffer is full, wait a bit
-                                    time.sleep(0.05)
-                                    continue
+                                report = self._report(current_time, peak_freq, peak_power, target_power_dB)
+                                last_send_time = current_time
+                                if not self.gating or self._gate_open(report):
+                                    pending.append(report)
+                                    if len(pending) >= self.report_batch:
+                                        self._send_reports(pending)
+                                        pending = []
+                                elif current_time - self._last_send_time >= self.heartbeat_interval:
+                                    self._send_heartbeat(report)
                     
                         time.sleep(0.02)  # Increased from 0.01 to reduce CPU usage
             except Exception as e:
                 print(f"Sender error: {e}")
                 time.sleep(1)  # Wait before retrying connection
 
+    def _sync_clock(self):
+        """
+        Update clock_offset from one ping/pong exchange with the receiver.
+
+        The offset of the exchange with the shortest round trip among the recent ones is used,
+        since queueing delays make the network path asymmetric.
+        """
+        self._send_message(encode_ping(time.time()))
+        msg_length = int.from_bytes(self._recv_exactly(4), byteorder='big')
+        payload = self._recv_exactly(msg_length)
+        pong_received = time.time()
+        msg_type, body = decode_message(payload)
+        if msg_type != MSG_PONG:
+            raise ConnectionError(f"Expected a pong, got message type {msg_type}")
+        self._clock_samples.append(clock_offset(*body, pong_received))
+        self.clock_offset = min(self._clock_samples, key=lambda sample: sample[1])[0]
+
+    def _recv_exactly(self, n):
+        """Read exactly n bytes from the control connection"""
+        chunks = []
+        while n > 0:
+            chunk = self.socket.recv(n)
+            if not chunk:
+                raise ConnectionError("Connection closed by receiver")
+            chunks.append(chunk)
+            n -= len(chunk)
+        return b''.join(chunks)
+
+    def _station_metadata(self):
+        """Fixed station description sent once in the binary-protocol hello"""
+        processor = self.audio_processor
+        return {
+            "name": self.name,
+            "location": list(self.location),
+            "sample_rate": processor.sample_rate,
+            "channels": processor.channels,
+            "localization": self.localization,
+            "max_targets": self.max_targets,
+            "temperature": self.audio_processor.temperature,
+            "humidity": self.audio_processor.humidity,
+            "station_id": self.station_id if self.transport == 'udp' else 0
+        }
+
+    def _report(self, timestamp, peak_freq, peak_power, target_power_dB):
+        """Detection report of the latest processed audio"""
+        detection = self.audio_processor.detection
+        frame_time = self.audio_processor.frame_time
+        report = {
+            "timestamp": timestamp,
+            "capture_time": (timestamp if frame_time is None else frame_time) + self.clock_offset,
+            "peak_freq": peak_freq,
+            "peak_freq_uncertainty": self.audio_processor.refined_peak['uncertainty'],
+            "peak_power": peak_power,
+            "location": self.location,
+            "name": self.name,
+            "target_power_dB": target_power_dB,
+            "fundamental": detection['fundamental'],
+            "snr_dB": detection['snr_dB'],
+            "confidence": detection['confidence'],
+            "detected": detection['detected'],
+            "peaks": self.audio_processor.peaks,
+            "range": self.audio_processor.range_estimate[0],
+            "range_uncertainty": self.audio_processor.range_estimate[1]
+        }
+        if self.localization == 'tdoa':
+            report.update(self._snapshot_message())
+        return report
+
+    def _gate_open(self, report):
+        """Whether a gated sender sends this report in full (see the gating argument)"""
+        active = bool(report['detected']) and report['target_power_dB'] > self.thresh_dB
+        last = self._last_full_report
+        if not (active or last is None or last[0]
+                or abs(report['target_power_dB'] - last[1]) > self.gate_power_tolerance_dB):
+            return False
+        self._last_full_report = (active, report['target_power_dB'])
+        return True
+
+    def _send_heartbeat(self, report):
+        """Send a heartbeat in place of a gated report"""
+        if self.protocol == 'binary':
+            self._send_payload(encode_heartbeat(report['capture_time'], self.station_id))
+        else:
+            heartbeat = {key: report[key] for key in ('timestamp', 'capture_time', 'location', 'name')}
+            heartbeat['heartbeat'] = True
+            self._last_send_time = time.time()
+            self._send_message(json.dumps(heartbeat).encode('utf-8'))
+
+    def _send_reports(self, reports):
+        """Send pending reports, batched into one message in the binary protocol"""
+        for report in reports:
+            report['sequence'] = self._sequence
+            self._sequence = (self._sequence + 1) & 0xFFFFFFFF
+        if self.protocol == 'binary':
+            self._send_payload(encode_reports(reports, self.spectrum_codec, self.station_id))
+            return
+        self._last_send_time = time.time()
+        for report in reports:
+            if 'snapshot' in report:
+                report = dict(report, snapshot=base64.b64encode(report['snapshot'].tobytes()).decode('ascii'))
+            self._send_message(json.dumps(report).encode('utf-8'))
+
+    def _send_payload(self, payload):
+        """Send a binary-protocol message by UDP if configured and it fits in a datagram, otherwise by TCP"""
+        self._last_send_time = time.time()
+        if self.transport == 'udp' and len(payload) <= MAX_DATAGRAM:
+            self.udp_socket.sendto(payload, (self.multicast_group or self.host, self.port))
+        else:
+            self._send_message(payload)
+
+    def _send_message(self, payload):
+        """Send one message with its 4-byte big-endian length prefix"""
+        self.socket.sendall(len(payload).to_bytes(4, byteorder='big') + payload)
+
+    def _snapshot(self):
+        """Band-limited spectrum of the latest audio frame for TDOA"""
+        processor = self.audio_processor
+        return spectral_snapshot(processor.latest_frame, processor.sample_rate,
+                                 processor.freq_min, processor.freq_max)
+
+    def _snapshot_message(self):
+        """Snapshot fields added to a sender report in TDOA mode"""
+        if self.audio_processor.frame_time is None:
+            return {}
+        start_bin, n_fft, spectrum = self._snapshot()
+        return {
+            "snapshot_start_bin": start_bin,
+            "snapshot_nfft": n_fft,
+            "snapshot": spectrum
+        }
+
     def _process_local_audio(self):
         """Process audio from local microphone"""
         with sd.InputStream(callback=self.audio_processor.audio_callback, 
-                           channels=1, 
+                           channels=self.audio_processor.channels, 
                            samplerate=self.audio_processor.sample_rate):
             print("Processing local audio...")
             while self.running:
                 peak_freq, peak_power, target_power_dB = self.audio_processor._update_stream(plot=False)
                 if peak_freq is not None and peak_power is not None:
-                    self.sender_data['local'] = (peak_freq, peak_power, self.location, self.name, target_power_dB)
-                    
-                    if len(self.sender_data) == len(self.clients) + 1:
-                        self._audio_calcs(print_data=True)
-                        self.sender_data.clear()
-                
-                time.sleep(0.2)  # Increased from 0.1 to reduce processing frequency
+                    detection = self.audio_processor.detection
+                    frame_time = self.audio_processor.frame_time
+                    capture_time = time.time() if frame_time is None else frame_time
+                    values = (peak_freq, peak_power, self.location, self.name, target_power_dB,
+                              detection['snr_dB'], detection['detected'], self.audio_processor.peaks,
+                              *(_float_or_nan(v) for v in self.audio_processor.range_estimate))
+                    snapshot = None
+                    if self.localization == 'tdoa' and frame_time is not None:
+                        snapshot = (frame_time, *self._snapshot())
+                    self.fusion.add('local', capture_time, (values, snapshot))
+                    if self.recorder is not None:
+                        self._record_local(capture_time, values, snapshot)
+
+                self._fuse_due(time.time(), print_data=True)
+                time.sleep(0.05)
+
+    def _record_local(self, capture_time, values, snapshot):
+        """Record the receiver's own report as a JSON message so replays include it"""
+        peak_freq, peak_power, location, name, target_power_dB, snr_dB, detected, peaks, target_range, range_sigma = values
+        report = {
+            "capture_time": capture_time, "peak_freq": peak_freq, "peak_power": peak_power,
+            "location": list(location), "name": name, "target_power_dB": target_power_dB,
+            "snr_dB": snr_dB, "detected": bool(detected), "peaks": peaks,
+            "range": None if np.isnan(target_range) else target_range,
+            "range_uncertainty": None if np.isnan(range_sigma) else range_sigma
+        }
+        if snapshot is not None:
+            _, start_bin, n_fft, spectrum = snapshot
+            report.update(snapshot_start_bin=start_bin, snapshot_nfft=n_fft,
+                          snapshot=base64.b64encode(spectrum.tobytes()).decode('ascii'))
+        self.recorder.write_message(time.time(), 'local', json.dumps(report).encode('utf-8'))
+
+    def _fuse_due(self, now, print_data=False):
+        """
+        Fuse every epoch whose deadline has passed with the stations that reported in time.
+
+        Returns:
+            int: Number of epochs fused
+        """
+        ready = self.fusion.due(now)
+        for epoch_time, reports in ready:
+            self.sender_data = {station: values for station, (values, _) in reports.items()}
+            self.snapshots = {station: snapshot for station, (_, snapshot) in reports.items()
+                              if snapshot is not None}
+            self._audio_calcs(print_data=print_data, timestamp=epoch_time)
+        return len(ready)
 
-    def _audio_calcs(self, print_data=False):
-        """Calculate audio data - only called by receiver stations"""
+    def _audio_calcs(self, print_data=False, timestamp=None):
+        """
+        Calculate audio data - only called by receiver stations
+
+        Args:
+            print_data (bool): Print the stations and fix
+            timestamp (float): Capture time of the fused reports (defaults to now)
+        """
         if self.station_type != 'receiver':
             raise RuntimeError("_audio_calcs should only be called by receiver stations")
+        if timestamp is None:
+            timestamp = time.time()
         
         # Clear old data lists but don't clear sender_data yet
         self.data['gnd_ip'] = []
@@ -286,14 +717,30 @@ class GroundStation:
         # Use sender_data directly instead of copying and clearing
         if print_data:
             print("\n=== Current Audio Data ===")
+            for name, (received, lost, late, loss) in self.loss_stats().items():
+                print(f"Link: {name:15} Received: {received} Lost: {lost} ({100 * loss:.1f}%) Late: {late}")
 
         triangulation_data = []
-        for gnd_ip, (freq, power, gnd_location, station_name, target_power_dB) in self.sender_data.items():
-            if target_power_dB > self.thresh_dB:
-                target_distance = calculate_distance(target_power_dB, reference_db=80.0, reference_distance=2.0)
+        range_weights = []
+        detected_stations = []
+        for gnd_ip, (freq, power, gnd_location, station_name, target_power_dB, snr_dB, detected, _,
+                     target_range, range_sigma) in self.sender_data.items():
+            # Only stations whose harmonic detector saw a rotor signature contribute a range
+            if detected and target_power_dB > self.thresh_dB:
+                if self.spectral_ranging and np.isfinite(target_range) and np.isfinite(range_sigma):
+                    # Spectral fit against the distance-labelled reference table, weighted by its variance
+                    target_distance = target_range
+                    range_variance = range_sigma**2
+                else:
+                    target_distance = calculate_distance(target_power_dB, reference_db=80.0, reference_distance=2.0,
+                                                         absorption=self._station_absorption(gnd_ip, freq))
+                    range_variance = (self.amplitude_range_error * target_distance)**2
             else:
                 target_distance = 0
-            triangulation_data.append((gnd_location, target_distance))
+            if target_distance > 0:
+                triangulation_data.append((gnd_location, target_distance))
+                range_weights.append(1 / max(range_variance, self.min_fix_variance))
+                detected_stations.append(gnd_ip)
             self.data['gnd_ip'].append(gnd_ip)
             self.data['freq'].append(freq)
             self.data['power'].append(power)
@@ -303,31 +750,93 @@ class GroundStation:
             self.data['station_names'].append(station_name)
 
             if print_data:
-                print(f"Station: {station_name:15} Location: {gnd_location[0]:.2f}, {gnd_location[1]:.2f} Frequency: {freq:.2f} Hz, Power: {power:.2f} dB, Source Distance: {target_distance:.2f} m, Target Power: {target_power_dB:.2f} dB")  
+                print(f"Station: {station_name:15} Location: {gnd_location[0]:.2f}, {gnd_location[1]:.2f} Frequency: {freq:.2f} Hz, Power: {power:.2f} dB, Source Distance: {target_distance:.2f} m, Target Power: {target_power_dB:.2f} dB, Detected: {detected}")  
     
-        x_target, y_target = triangulate_target(triangulation_data)
-        
-        # Apply low-pass filter to both x and y coordinates
-        filtered_x = self.target_filter_alpha * x_target + (1 - self.target_filter_alpha) * self.filtered_target[0]
+        if self.max_targets > 1:
+            self._multi_target_calcs(print_data, timestamp)
+            self.sender_data.clear()
+            self.snapshots.clear()
+            return
 
-        filtered_y = self.target_filter_alpha * y_target + (1 - self.target_filter_alpha) * self.filtered_target[1]
-        
-        self.filtered_target = (filtered_x, filtered_y)
-        x_target, y_target = self.filtered_target
-        
-        self.data['target_location'] = (self.filtered_target[0], self.filtered_target[1])
-        
+        # Skip triangulation entirely on frames where no station heard a drone
+        if not triangulation_data:
+            if print_data:
+                print("No detection")
+                print("========================\n")
+            self.sender_data.clear()
+            self.snapshots.clear()
+            return
+
+        fix = self._tdoa_target(detected_stations) if self.localization == 'tdoa' else None
+        if fix is None:
+            fix = solve_circles([c for c, _ in triangulation_data], [r for _, r in triangulation_data], range_weights)
+        position, covariance = fix
+
+        # Fuse the fix into the tracker with its covariance
+        if np.all(np.isfinite(position)) and np.all(np.isfinite(covariance)):
+            self.tracker.update(position, covariance + self.min_fix_variance * np.eye(2), timestamp)
+        if self.tracker.initialized:
+            x_target, y_target = self.tracker.x[:2]
+            self.data['target_location'] = (x_target, y_target)
+            if print_data:
+                print(f"Target Location: {x_target:.2f}, {y_target:.2f}")
         if print_data:
-            print(f"Target Location: {x_target:.2f}, {y_target:.2f}")
             print("========================\n")
 
         # Only clear sender_data after we're completely done with processing
         # This ensures the plotting function has access to the data
         self.sender_data.clear()
+        self.snapshots.clear()
+
+    def _multi_target_calcs(self, print_data=False, timestamp=None):
+        """Associate every station's peaks into targets, locate each one and update its track"""
+        reports = {gnd_ip: values[7] for gnd_ip, values in self.sender_data.items()}
+        fixes = []
+        for group in associate_peaks(reports):
+            # A peak's power_dB is the band total its signature alone produces, the quantity
+            # the target_power_dB calibration (80 dB at 2 m) is defined for
+            circles = [(self.sender_data[gnd_ip][2],
+                        calculate_distance(peak[3], reference_db=80.0, reference_distance=2.0,
+                                           absorption=self._station_absorption(gnd_ip, peak[0])))
+                       for gnd_ip, peak in group.items() if peak[3] > self.thresh_dB]
+            if not circles:
+                continue
+            position, covariance = solve_circles([c for c, _ in circles], [r for _, r in circles])
+            if np.all(np.isfinite(position)) and np.all(np.isfinite(covariance)):
+                fundamental = np.mean([peak[0] for peak in group.values()])
+                fixes.append((position, covariance + self.min_fix_variance * np.eye(2), fundamental))
+
+        tracks = self.multi_tracker.update(fixes, time.time() if timestamp is None else timestamp)
+        self.data['targets'] = [(t['id'], t['freq'], *t['filter'].x[:2]) for t in tracks]
+        self.data['target_location'] = tuple(tracks[0]['filter'].x[:2]) if tracks else None
+        if print_data:
+            if not tracks:
+                print("No detection")
+            for track_id, freq, x_target, y_target in self.data['targets']:
+                print(f"Target {track_id}: {freq:.1f} Hz at {x_target:.2f}, {y_target:.2f}")
+            print("========================\n")
+
+    def _tdoa_target(self, stations):
+        """Locate the target (position, covariance) from the snapshots of detecting stations, or None if there are
+        too few or tdoa_localize rejects the fix (ambiguous comb, too little overlap, inconsistent residual)"""
+        stations = [s for s in stations if s in self.snapshots]
+        if len(stations) < 3:
+            return None
+        capture_times, start_bins, n_ffts, spectra = zip(*(self.snapshots[s] for s in stations))
+        if len(set(start_bins)) != 1 or len(set(n_ffts)) != 1 or len({len(x) for x in spectra}) != 1:
+            return None
+        positions = np.array([self.sender_data[s][2] for s in stations], dtype=float)
+        result = tdoa_localize(np.stack(spectra), positions, capture_times, start_bins[0], n_ffts[0],
+                               self.audio_processor.sample_rate)
+        if result is None:
+            return None
+        target, covariance, _ = result
+        return target, covariance
 
     
     def _setup_plot(self):
         """Initialize the real-time plotting"""
+        import matplotlib.pyplot as plt
         plt.ion()  # Enable interactive mode
         self.fig, self.ax = plt.subplots(figsize=(10, 10))
         self.ax.set_xlabel("X Position (m)")
@@ -349,6 +858,8 @@ class GroundStation:
 
     def _animate(self, frame):
         """Animation update function"""
+        import matplotlib.pyplot as plt
+        from matplotlib.patches import Circle
         if not plt.fignum_exists(self.fig.number):
             return
         
@@ -400,12 +911,31 @@ class GroundStation:
                 del self.circle_plots[source]
 
         # Update target location only if signal is above threshold
-        if self.data['target_location'] is not None and any_signal_above_threshold:
-            x_target, y_target = self.data['target_location']
+        if self.max_targets > 1:
+            positions = [(x, y) for _, x, y in self.multi_tracker.positions_at(time.time())]
+            self.target_plot.set_data([p[0] for p in positions], [p[1] for p in positions])
+        elif self.data['target_location'] is not None and any_signal_above_threshold:
+            # Draw the tracker's prediction for now so the marker moves between fixes
+            x_target, y_target = self.tracker.position_at(time.time())
             self.target_plot.set_data([x_target], [y_target])
         else:
             self.target_plot.set_data([], [])
 
+def _float_or_nan(value):
+    """Optional report number as a float (NaN when missing)"""
+    return np.nan if value is None else float(value)
+
+class _ReportDatagrams(asyncio.DatagramProtocol):
+    """Passes UDP report datagrams to the receiving ground station"""
+    def __init__(self, station):
+        self.station = station
+
+    def datagram_received(self, data, addr):
+        try:
+            self.station._handle_datagram(data)
+        except Exception as e:
+            print(f"Error handling datagram from {addr[0]}: {e}")
+
 if __name__ == "__main__":
     # Example usage as receiver:
     station = GroundStation('receiver', host='0.0.0.0', port=58392, plot_enabled=True, name="Main", low_cutoff_Hz=500, thresh_dB=30)
@@ -0,0 +1,184 @@
+import numpy as np
+
+class HarmonicDetector:
+    """
+    Harmonic-comb detector for rotor noise (a fundamental plus harmonics).
+
+    Every candidate fundamental on the FFT bin grid in [f0_min, f0_max] is scored by
+    combining the spectrum at its first n_harmonics multiples. The bin index of each
+    (candidate, harmonic) pair is precomputed once, so scoring a frame is a single
+    fancy-index and reduction over a [n_candidates, n_harmonics] table. Harmonics past
+    the last bin count as misses (noise-floor power, never above threshold), so a
+    high candidate cannot win on its fundamental alone.
+    """
+    def __init__(self, freqs, f0_min, f0_max, n_harmonics=5, weights=None, tolerance_bins=1,
+                 method='product', harmonic_thresh_dB=10.0):
+        """
+        Args:
+            freqs (ndarray): Ascending FFT bin frequencies starting at 0 Hz (uniform spacing)
+            f0_min, f0_max (float): Range of candidate fundamentals in Hz
+            n_harmonics (int): Number of harmonics (including the fundamental) per candidate
+            weights (array-like): Per-harmonic weights, defaults to equal weighting
+            tolerance_bins (int): Harmonics may fall this many bins away from k * f0
+            method (str): 'sum' (harmonic sum) or 'product' (harmonic product spectrum)
+            harmonic_thresh_dB (float): Level above the noise floor for a harmonic to count toward confidence
+        """
+        if method not in ('sum', 'product'):
+            raise ValueError("method must be either 'sum' or 'product'")
+        self.freqs = freqs
+        self.n_bins = len(freqs)
+        self.n_harmonics = n_harmonics
+        self.tolerance_bins = tolerance_bins
+        self.method = method
+        self.harmonic_thresh = 10 ** (harmonic_thresh_dB / 10)
+
+        lo = max(int(np.searchsorted(freqs, f0_min, side='left')), 1)
+        hi = int(np.searchsorted(freqs, f0_max, side='right'))
+        self.band = slice(lo, hi)
+        self.candidates = freqs[lo:hi]
+
+        # Harmonic index table: bin of the k-th harmonic of each candidate
+        harmonics = np.arange(1, n_harmonics + 1)
+        index = np.arange(lo, hi)[:, None] * harmonics[None, :]
+        self.valid = index < self.n_bins
+        self.index = np.where(self.valid, index, 0)
+
+        self.weights = np.ones(n_harmonics) if weights is None else np.asarray(weights, dtype=float)
+        self.weight_sum = max(self.weights.sum(), 1e-12)
+
+    def _widen(self, power):
+        """Max over +/- tolerance_bins so slightly detuned harmonics still land on their bin"""
+        if self.tolerance_bins == 0:
+            return power
+        widened = power.copy()
+        for shift in range(1, self.tolerance_bins + 1):
+            np.maximum(widened[..., shift:], power[..., :-shift], out=widened[..., shift:])
+            np.maximum(widened[..., :-shift], power[..., shift:], out=widened[..., :-shift])
+        return widened
+
+    def scores(self, fft_data):
+        """
+        Harmonic score for every candidate fundamental.
+
+        Args:
+            fft_data (ndarray): [..., n_bins] complex spectra
+        Returns:
+            tuple: (scores [..., n_candidates], noise floor [...], widened power [..., n_bins]),
+                   all in linear power
+        """
+        power = np.abs(fft_data) ** 2
+        noise = np.median(power[..., self.band], axis=-1) + 1e-20
+        widened = self._widen(power)
+        harmonic_power = widened[..., self.index]  # [..., n_candidates, n_harmonics]
+        harmonic_power = np.where(self.valid, harmonic_power, noise[..., None, None])
+
+        if self.method == 'sum':
+            scores = np.sum(harmonic_power * self.weights, axis=-1) / self.weight_sum
+        else:
+            log_power = np.log(harmonic_power + 1e-20)
+            scores = np.exp(np.sum(log_power * self.weights, axis=-1) / self.weight_sum)
+        return scores, noise, widened
+
+    def detect(self, fft_data):
+        """
+        Find the most likely rotor fundamental.
+
+        Args:
+            fft_data (ndarray): [n_bins] or [n_frames, n_bins] complex spectra
+        Returns:
+            tuple: (fundamental Hz, harmonic-weighted SNR in dB, confidence 0-1), as
+                   scalars for a single frame or arrays for a batch
+        """
+        if len(self.candidates) == 0:
+            return None, None, None
+
+        scores, noise, widened = self.scores(fft_data)
+        best = np.argmax(scores, axis=-1)
+        best_score = np.take_along_axis(scores, best[..., None], axis=-1)[..., 0]
+
+        fundamental = self.candidates[best]
+        snr_dB = 10 * np.log10(best_score / noise + 1e-20)
+
+        # Confidence: fraction of the winning candidate's harmonics clearly above the noise floor
+        best_power = np.take_along_axis(widened, self.index[best], axis=-1)
+        above = (best_power > noise[..., None] * self.harmonic_thresh) & self.valid[best]
+        confidence = np.sum(above, axis=-1) / self.n_harmonics
+
+        if np.ndim(fundamental) == 0:
+            return float(fundamental), float(snr_dB), float(confidence)
+        return fundamental, snr_dB, confidence
+
+    def detect_top_k(self, fft_data, k=3, min_separation=0.03, lobe_bins=2):
+        """
+        The k strongest distinct rotor signatures in one spectrum.
+
+        Candidates must be local maxima of the harmonic score, and a candidate is
+        skipped when it lies within min_separation (relative) of an integer multiple
+        or submultiple of an already selected fundamental, so one drone's harmonics
+        are not reported as extra targets.
+
+        Args:
+            fft_data (ndarray): [n_bins] complex spectrum
+            k (int): Maximum number of signatures to return
+            min_separation (float): Relative frequency tolerance for the harmonic suppression
+            lobe_bins (int): Bins on each side of a harmonic summed into power_dB (Hann main lobe)
+        Returns:
+            tuple: (fundamentals, snr_dB, confidence, power_dB) arrays of length <= k, strongest first.
+                   power_dB is 20 log10 of the magnitudes summed over each harmonic's main lobe,
+                   i.e. the band total (target_power_dB) the signature alone would produce.
+        """
+        if len(self.candidates) == 0:
+            empty = np.empty(0)
+            return empty, empty, empty, empty
+
+        scores, noise, widened = self.scores(fft_data)
+        is_peak = np.ones(len(scores), dtype=bool)
+        is_peak[1:] &= scores[1:] >= scores[:-1]
+        is_peak[:-1] &= scores[:-1] > scores[1:]
+        order = np.flatnonzero(is_peak)
+        order = order[np.argsort(scores[order])[::-1]]
+
+        selected = []
+        for idx in order:
+            f = self.candidates[idx]
+            related = False
+            for chosen in selected:
+                ratio = max(f, self.candidates[chosen]) / min(f, self.candidates[chosen])
+                if abs(ratio - np.rint(ratio)) < min_separation * ratio:
+                    related = True
+                    break
+            if not related:
+                selected.append(idx)
+                if len(selected) == k:
+                    break
+
+        selected = np.array(selected, dtype=int)
+        lobes = self.index[selected][..., None] + np.arange(-lobe_bins, lobe_bins + 1)
+        in_lobe = self.valid[selected][..., None] & (lobes >= 0) & (lobes < self.n_bins)
+        magnitudes = np.abs(fft_data)[np.where(in_lobe, lobes, 0)] * in_lobe
+        above = (widened[self.index[selected]] > noise * self.harmonic_thresh) & self.valid[selected]
+        return (self.candidates[selected],
+                10 * np.log10(scores[selected] / noise + 1e-20),
+                np.sum(above, axis=1) / self.n_harmonics,
+                20 * np.log10(np.sum(magnitudes, axis=(1, 2)) + 1e-10))
+
+if __name__ == "__main__":
+    # Self-check: a rotor-like harmonic comb is detected, a single pure tone is not
+    sample_rate, n_fft = 44100, 4096
+    freqs = np.fft.rfftfreq(n_fft, 1 / sample_rate)
+    t = np.arange(n_fft) / sample_rate
+    window = np.hanning(n_fft)
+    rng = np.random.default_rng(0)
+    detector = HarmonicDetector(freqs, 100, 10000)
+
+    comb = sum(np.sin(2 * np.pi * 620 * h * t) / h for h in range(1, 6))
+    f0, snr_dB, confidence = detector.detect(np.fft.rfft((comb + 1e-3 * rng.standard_normal(n_fft)) * window))
+    print(f"Harmonic comb: f0 {f0:.1f} Hz, SNR {snr_dB:.1f} dB, confidence {confidence:.2f}")
+    assert abs(f0 - 620) < 2 * freqs[1] and confidence >= 0.8
+
+    for tone in (1000, 6000, 7000, 9000):
+        spectrum = np.fft.rfft((np.sin(2 * np.pi * tone * t) + 1e-3 * rng.standard_normal(n_fft)) * window)
+        f0, snr_dB, confidence = detector.detect(spectrum)
+        top_confidence = detector.detect_top_k(spectrum)[2]
+        print(f"{tone} Hz tone: f0 {f0:.1f} Hz, SNR {snr_dB:.1f} dB, confidence {confidence:.2f}")
+        assert confidence < 0.5 and np.all(top_confidence < 0.5)
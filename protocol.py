@@ -0,0 +1,229 @@
+import json
+import struct
+import numpy as np
+
+# Binary sender -> receiver protocol, carried inside the 4-byte length-prefixed framing.
+#
+# Every message starts with HEADER. A connection opens with one MSG_HELLO whose body is the
+# station metadata as JSON (name, location, ...), sent once. After that, MSG_REPORTS messages
+# carry n_records fixed-layout REPORT_DTYPE records, then n_peaks PEAK_DTYPE records (each
+# report's n_peaks, in order), then the TDOA snapshot bins of every report with snapshot_bins > 0.
+# Everything is little-endian, so the receiver decodes it with np.frombuffer without copying.
+# The header's station id identifies the sender of connectionless (UDP) messages; it is
+# announced as 'station_id' in the hello over the TCP control connection.
+# MSG_PING / MSG_PONG carry the NTP-style timestamps senders use to estimate their clock
+# offset from the receiver, so report capture times are on the receiver's clock.
+# MSG_HEARTBEAT replaces reports while a gated sender hears nothing; it only carries a capture time.
+# Version 2 added the spectral range estimate to REPORT_DTYPE; version 1 reports are still decoded
+# (with NaN ranges).
+
+MAGIC = b'DRN\x00'
+VERSION = 2
+MSG_HELLO = 1
+MSG_REPORTS = 2
+MSG_PING = 3
+MSG_PONG = 4
+MSG_HEARTBEAT = 5
+
+# magic, version, message type, n_records, n_peaks, spectrum codec, station id (0 = unset)
+HEADER = struct.Struct('<4sBBHHHI')
+
+# Ping: sender send time; pong: echoed sender send time, receiver receive and send times
+PING = struct.Struct('<d')
+PONG = struct.Struct('<ddd')
+# Heartbeat: capture time on the receiver's clock
+HEARTBEAT = struct.Struct('<d')
+
+# Largest UDP payload; bigger report messages have to go over TCP
+MAX_DATAGRAM = 65507
+
+REPORT_DTYPE = np.dtype([
+    ('timestamp', '<f8'),
+    ('capture_time', '<f8'),           # NaN when the sender has no capture time
+    ('peak_freq', '<f4'),
+    ('peak_freq_uncertainty', '<f4'),
+    ('peak_power', '<f4'),
+    ('target_power_dB', '<f4'),
+    ('fundamental', '<f4'),
+    ('snr_dB', '<f4'),
+    ('confidence', '<f4'),
+    ('detected', 'u1'),
+    ('n_peaks', 'u1'),
+    ('reserved', 'u1', 2),
+    ('sequence', '<u4'),
+    ('snapshot_start_bin', '<u4'),
+    ('snapshot_nfft', '<u4'),
+    ('snapshot_bins', '<u4'),
+    ('range', '<f4'),                  # Spectral range estimate in m, NaN when the sender has none
+    ('range_uncertainty', '<f4'),
+])  # 72 bytes
+
+# Version 1 report layout
+REPORT_DTYPE_V1 = np.dtype([(name, REPORT_DTYPE.fields[name][0]) for name in REPORT_DTYPE.names[:-2]])  # 64 bytes
+
+PEAK_DTYPE = np.dtype([
+    ('fundamental', '<f4'),
+    ('snr_dB', '<f4'),
+    ('confidence', '<f4'),
+    ('power_dB', '<f4'),
+])
+
+# Snapshot encodings: full complex64, or float16 real/imaginary pairs at half the size
+SPECTRUM_CODECS = {'complex64': 0, 'float16': 1}
+_CODEC_DTYPES = {0: np.dtype('<c8'), 1: np.dtype('<f2')}
+
+_FLOAT_FIELDS = ('timestamp', 'capture_time', 'peak_freq', 'peak_freq_uncertainty', 'peak_power',
+                 'target_power_dB', 'fundamental', 'snr_dB', 'confidence', 'range', 'range_uncertainty')
+
+def encode_hello(metadata):
+    """
+    Station metadata message sent once per connection.
+
+    Args:
+        metadata (dict): JSON-serializable station description (name, location, ...)
+    """
+    return (HEADER.pack(MAGIC, VERSION, MSG_HELLO, 0, 0, 0, metadata.get('station_id', 0))
+            + json.dumps(metadata).encode('utf-8'))
+
+def encode_ping(sent):
+    """Clock-offset request stamped with the sender's send time"""
+    return HEADER.pack(MAGIC, VERSION, MSG_PING, 0, 0, 0, 0) + PING.pack(sent)
+
+def encode_pong(ping_sent, received, sent):
+    """Reply to a ping with the receiver's receive and send times"""
+    return HEADER.pack(MAGIC, VERSION, MSG_PONG, 0, 0, 0, 0) + PONG.pack(ping_sent, received, sent)
+
+def encode_heartbeat(capture_time, station_id=0):
+    """Keep-alive sent instead of a report while a gated sender has no detection"""
+    return HEADER.pack(MAGIC, VERSION, MSG_HEARTBEAT, 0, 0, 0, station_id) + HEARTBEAT.pack(capture_time)
+
+def clock_offset(ping_sent, received, sent, pong_received):
+    """
+    NTP clock offset and round-trip delay from one ping/pong exchange.
+
+    Returns:
+        tuple: (receiver clock minus sender clock, round-trip network delay) in seconds
+    """
+    offset = ((received - ping_sent) + (sent - pong_received)) / 2
+    delay = (pong_received - ping_sent) - (sent - received)
+    return offset, delay
+
+def encode_reports(reports, codec='complex64', station_id=0):
+    """
+    Pack one or more detection reports into a single message.
+
+    Args:
+        reports (list): Report dicts with the REPORT_DTYPE field names (None is sent as NaN),
+                        an optional 'peaks' list of [fundamental, snr_dB, confidence, power_dB]
+                        and an optional 'snapshot' complex band spectrum
+        codec (str): Snapshot encoding, one of SPECTRUM_CODECS
+        station_id (int): Sender id for messages that are not tied to a connection
+    Returns:
+        bytes: Message body (without the length prefix)
+    """
+    if codec not in SPECTRUM_CODECS:
+        raise ValueError(f"codec must be one of {list(SPECTRUM_CODECS)}")
+
+    records = np.zeros(len(reports), dtype=REPORT_DTYPE)
+    peaks, spectra = [], []
+    for i, report in enumerate(reports):
+        for field in _FLOAT_FIELDS:
+            value = report.get(field)
+            records[field][i] = np.nan if value is None else value
+        records['detected'][i] = bool(report.get('detected', True))
+        records['sequence'][i] = report.get('sequence', 0)
+
+        report_peaks = report.get('peaks') or []
+        records['n_peaks'][i] = len(report_peaks)
+        peaks.extend(tuple(peak) for peak in report_peaks)
+
+        snapshot = report.get('snapshot')
+        if snapshot is not None:
+            records['snapshot_start_bin'][i] = report['snapshot_start_bin']
+            records['snapshot_nfft'][i] = report['snapshot_nfft']
+            records['snapshot_bins'][i] = len(snapshot)
+            spectra.append(np.asarray(snapshot, dtype=np.complex64))
+
+    peak_records = np.array(peaks, dtype=PEAK_DTYPE)
+    parts = [HEADER.pack(MAGIC, VERSION, MSG_REPORTS, len(records), len(peak_records), SPECTRUM_CODECS[codec],
+                         station_id),
+             records.tobytes(), peak_records.tobytes()]
+    for spectrum in spectra:
+        if codec == 'float16':
+            spectrum = spectrum.view(np.float32).astype('<f2')
+        parts.append(spectrum.tobytes())
+    return b''.join(parts)
+
+def is_binary(payload):
+    """Whether a message uses this protocol (JSON messages from older senders start with '{')"""
+    return bytes(payload[:4]) == MAGIC
+
+def header_station_id(payload):
+    """Station id in a message header, or None if the message is not in this protocol"""
+    if len(payload) < HEADER.size or not is_binary(payload):
+        return None
+    return HEADER.unpack_from(payload)[-1]
+
+def _upgrade_records(records):
+    """Version 1 report records widened to REPORT_DTYPE"""
+    upgraded = np.zeros(len(records), dtype=REPORT_DTYPE)
+    for name in REPORT_DTYPE_V1.names:
+        upgraded[name] = records[name]
+    upgraded['range'] = np.nan
+    upgraded['range_uncertainty'] = np.nan
+    return upgraded
+
+def decode_message(payload):
+    """
+    Decode a message body.
+
+    Args:
+        payload (bytes): Message body (without the length prefix)
+    Returns:
+        tuple: (MSG_HELLO, metadata dict), (MSG_PING, (sent,)), (MSG_PONG, (ping_sent, received, sent)),
+               (MSG_HEARTBEAT, (capture_time,)) or (MSG_REPORTS, (records, peaks, spectra)) where records
+               is a REPORT_DTYPE array, peaks a list of PEAK_DTYPE arrays (one per record) and
+               spectra a list of complex64 snapshots or None (one per record). Arrays are read-only
+               views into payload except float16 snapshots, which are widened.
+    """
+    magic, version, msg_type, n_records, n_peaks, codec, _ = HEADER.unpack_from(payload)
+    if magic != MAGIC:
+        raise ValueError("Not a binary protocol message")
+    if version not in (1, VERSION):
+        raise ValueError(f"Unsupported protocol version {version}")
+
+    if msg_type == MSG_HELLO:
+        return msg_type, json.loads(bytes(payload[HEADER.size:]).decode('utf-8'))
+    if msg_type == MSG_PING:
+        return msg_type, PING.unpack_from(payload, HEADER.size)
+    if msg_type == MSG_PONG:
+        return msg_type, PONG.unpack_from(payload, HEADER.size)
+    if msg_type == MSG_HEARTBEAT:
+        return msg_type, HEARTBEAT.unpack_from(payload, HEADER.size)
+    if msg_type != MSG_REPORTS:
+        raise ValueError(f"Unknown message type {msg_type}")
+    if codec not in _CODEC_DTYPES:
+        raise ValueError(f"Unknown spectrum codec {codec}")
+
+    offset = HEADER.size
+    records = np.frombuffer(payload, dtype=REPORT_DTYPE if version == VERSION else REPORT_DTYPE_V1,
+                            count=n_records, offset=offset)
+    offset += records.nbytes
+    if version == 1:
+        records = _upgrade_records(records)
+    peak_records = np.frombuffer(payload, dtype=PEAK_DTYPE, count=n_peaks, offset=offset)
+    offset += peak_records.nbytes
+    peaks = np.split(peak_records, np.cumsum(records['n_peaks'])[:-1]) if n_records else []
+
+    spectra = []
+    dtype = _CODEC_DTYPES[codec]
+    for n_bins in records['snapshot_bins']:
+        if n_bins == 0:
+            spectra.append(None)
+            continue
+        count = int(n_bins) * (2 if codec == SPECTRUM_CODECS['float16'] else 1)
+        values = np.frombuffer(payload, dtype=dtype, count=count, offset=offset)
+        offset += values.nbytes
+        spectra.append(values if codec == SPECTRUM_CODECS['complex64']
+                       else values.astype(np.float32).view(np.complex64))
+    return msg_type, (records, peaks, spectra)
@@ -0,0 +1,268 @@
+import os
+import mmap
+import json
+import struct
+import time
+import numpy as np
+from bisect import bisect_left
+from threading import Lock
+from protocol import is_binary, decode_message, MSG_PING, MSG_PONG
+
+# Append-only log of raw audio blocks and received station messages.
+#
+# The file starts with FILE_HEADER. Each entry is RECORD_HEADER (kind, source length,
+# payload length, timestamp) followed by the source name (UTF-8) and the payload, padded
+# to 8 bytes so audio samples can be viewed in place. Audio payloads are AUDIO_HEADER
+# (sample rate, channels) plus float32 samples in [frames, channels] order. Message payloads
+# are the message bodies exactly as received (binary protocol or JSON).
+# A timestamp index (INDEX_DTYPE) is written next to the log as <path>.idx; without it the
+# log is scanned. Entries are in write order, which is not timestamp order (audio carries its
+# ADC capture time, messages their receive time), so readers sort the index by timestamp.
+
+FILE_MAGIC = b'DRNLOG\x00\x00'
+FILE_VERSION = 1
+FILE_HEADER = struct.Struct('<8sI4x')
+RECORD_HEADER = struct.Struct('<BxHId')
+AUDIO_HEADER = struct.Struct('<II')
+INDEX_DTYPE = np.dtype([('timestamp', '<f8'), ('offset', '<u8'), ('kind', 'u1')])
+
+KIND_AUDIO = 1
+KIND_MESSAGE = 2
+
+def _padded(n):
+    return (n + 7) & ~7
+
+class Recorder:
+    """
+    Writes audio blocks and station messages to a memory-mapped append-only log.
+
+    The file is grown in chunk_bytes steps and remapped, so most writes are a memcpy into
+    the map. Writes are serialized with a lock because the audio callback and the network
+    loop record from different threads.
+    """
+    def __init__(self, path, chunk_bytes=1 << 26):
+        """
+        Args:
+            path (str): Log file, created or truncated
+            chunk_bytes (int): Growth step of the file
+        """
+        self.path = path
+        self.chunk_bytes = chunk_bytes
+        self._file = open(path, 'w+b')
+        self._file.truncate(chunk_bytes)
+        self._map = mmap.mmap(self._file.fileno(), chunk_bytes)
+        FILE_HEADER.pack_into(self._map, 0, FILE_MAGIC, FILE_VERSION)
+        self.size = FILE_HEADER.size
+        self._index = []
+        self._lock = Lock()
+
+    def _reserve(self, n):
+        """Grow the file and map so n more bytes fit"""
+        capacity = len(self._map)
+        if self.size + n <= capacity:
+            return
+        while capacity < self.size + n:
+            capacity += self.chunk_bytes
+        self._map.flush()
+        self._map.close()
+        self._file.truncate(capacity)
+        self._map = mmap.mmap(self._file.fileno(), capacity)
+
+    def write(self, kind, timestamp, payload, source=''):
+        """
+        Append one entry.
+
+        Args:
+            kind (int): KIND_AUDIO or KIND_MESSAGE
+            timestamp (float): Wall-clock time of the entry
+            payload (bytes-like): Entry data
+            source (str): Station the entry came from
+        """
+        source = source.encode('utf-8')
+        payload = memoryview(payload).cast('B')
+        length = _padded(RECORD_HEADER.size + len(source) + len(payload))
+        with self._lock:
+            self._reserve(length)
+            offset = self.size
+            RECORD_HEADER.pack_into(self._map, offset, kind, len(source), len(payload), timestamp)
+            start = offset + RECORD_HEADER.size
+            self._map[start:start + len(source)] = source
+            start += len(source)
+            self._map[start:start + len(payload)] = payload
+            self.size = offset + length
+            self._index.append((timestamp, offset, kind))
+
+    def write_audio(self, timestamp, block, sample_rate):
+        """
+        Append an audio block.
+
+        Args:
+            timestamp (float): Capture time of the block's first sample
+            block (ndarray): [frames] or [frames, channels] samples
+            sample_rate (int): Sample rate in Hz
+        """
+        block = np.ascontiguousarray(block, dtype=np.float32)
+        channels = 1 if block.ndim == 1 else block.shape[1]
+        self.write(KIND_AUDIO, timestamp, AUDIO_HEADER.pack(sample_rate, channels) + block.tobytes())
+
+    def write_message(self, timestamp, source, payload):
+        """Append a received station message body"""
+        self.write(KIND_MESSAGE, timestamp, payload, source)
+
+    def flush(self):
+        """Flush the log and write the index"""
+        with self._lock:
+            self._map.flush()
+            np.array(self._index, dtype=INDEX_DTYPE).tofile(self.path + '.idx')
+
+    def close(self):
+        """Flush, trim the file to its used length and close it"""
+        self.flush()
+        with self._lock:
+            self._map.close()
+            self._file.truncate(self.size)
+            self._file.close()
+
+class Recording:
+    """Read-only view of a log written by Recorder"""
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = FILE_HEADER.unpack_from(self._map, 0)
+        if magic != FILE_MAGIC:
+            raise ValueError(f"{path} is not a recording")
+        if version != FILE_VERSION:
+            raise ValueError(f"Unsupported recording version {version}")
+
+        index_path = path + '.idx'
+        index = np.fromfile(index_path, dtype=INDEX_DTYPE) if os.path.exists(index_path) else self._scan()
+        # Stable, so entries with equal timestamps keep their write order
+        self.index = index[np.argsort(index['timestamp'], kind='stable')]
+
+    def _scan(self):
+        """Rebuild the index by walking the log (for logs whose writer did not close cleanly)"""
+        entries = []
+        offset = FILE_HEADER.size
+        while offset + RECORD_HEADER.size <= len(self._map):
+            kind, source_len, payload_len, timestamp = RECORD_HEADER.unpack_from(self._map, offset)
+            if kind not in (KIND_AUDIO, KIND_MESSAGE):
+                break  # Unused space at the end of the map
+            entries.append((timestamp, offset, kind))
+            offset += _padded(RECORD_HEADER.size + source_len + payload_len)
+        return np.array(entries, dtype=INDEX_DTYPE)
+
+    def entries(self, start=None, stop=None, kind=None):
+        """
+        Iterate over entries in timestamp order.
+
+        Args:
+            start, stop (float): Optional timestamp range [start, stop)
+            kind (int): Only entries of this kind
+        Yields:
+            tuple: (kind, timestamp, source, payload memoryview)
+        """
+        first = 0 if start is None else bisect_left(self.index['timestamp'], start)
+        for timestamp, offset, entry_kind in self.index[first:]:
+            if stop is not None and timestamp >= stop:
+                break
+            if kind is not None and entry_kind != kind:
+                continue
+            _, source_len, payload_len, _ = RECORD_HEADER.unpack_from(self._map, offset)
+            start_byte = int(offset) + RECORD_HEADER.size
+            source = bytes(self._map[start_byte:start_byte + source_len]).decode('utf-8')
+            start_byte += source_len
+            yield entry_kind, float(timestamp), source, memoryview(self._map)[start_byte:start_byte + payload_len]
+
+    def audio_blocks(self, start=None, stop=None):
+        """
+        Yields:
+            tuple: (timestamp, [frames, channels] float32 view, sample rate)
+        """
+        for _, timestamp, _, payload in self.entries(start, stop, KIND_AUDIO):
+            sample_rate, channels = AUDIO_HEADER.unpack_from(payload)
+            samples = np.frombuffer(payload, dtype=np.float32, offset=AUDIO_HEADER.size)
+            yield timestamp, samples.reshape(-1, channels), sample_rate
+
+    def messages(self, start=None, stop=None):
+        """
+        Yields:
+            tuple: (timestamp, source, message body)
+        """
+        for _, timestamp, source, payload in self.entries(start, stop, KIND_MESSAGE):
+            yield timestamp, source, payload
+
+def _pace(timestamp, first_timestamp, started, speed):
+    """Sleep until `timestamp` is due when replaying at `speed` times real time"""
+    if speed:
+        delay = (timestamp - first_timestamp) / speed - (time.perf_counter() - started)
+        if delay > 0:
+            time.sleep(delay)
+
+def replay_audio(recording, processor, speed=None, start=None, stop=None):
+    """
+    Feed recorded audio through an AudioProcessor.
+
+    Args:
+        recording (Recording): Source log
+        processor (AudioProcessor): Processor to feed; its sample rate and channels must match the recording
+        speed (float): Multiple of real time to replay at (None = as fast as possible)
+        start, stop (float): Optional timestamp range
+    Yields:
+        tuple: (timestamp, peak_freq, peak_power, total_power) whenever new frames were processed
+    """
+    started = time.perf_counter()
+    first_timestamp = None
+    for timestamp, block, sample_rate in recording.audio_blocks(start, stop):
+        if sample_rate != processor.sample_rate:
+            raise ValueError(f"Recording is {sample_rate} Hz but the processor runs at {processor.sample_rate} Hz")
+        if first_timestamp is None:
+            first_timestamp = timestamp
+        _pace(timestamp, first_timestamp, started, speed)
+
+        processor.clock_anchor = (processor.ring.write_pos, timestamp)
+        processor.ring.push(block[:, 0] if processor.channels == 1 else block[:, :processor.channels])
+        while processor.backlog() > 0:
+            peak_freq, peak_power, total_power = processor._update_stream(plot=False)
+            if peak_freq is None:
+                break
+            yield processor.frame_time, peak_freq, peak_power, total_power
+
+def replay_messages(recording, station, speed=None, start=None, stop=None, print_data=False):
+    """
+    Feed recorded station messages through a receiver's decoding and fusion path.
+
+    Recorded timestamps stand in for the receiver's clock, so epochs are fused exactly
+    as they would have been live.
+
+    Args:
+        recording (Recording): Source log
+        station (GroundStation): Receiver to feed
+        speed (float): Multiple of real time to replay at (None = as fast as possible)
+        start, stop (float): Optional timestamp range
+        print_data (bool): Print every fused epoch
+    Returns:
+        int: Number of fused epochs
+    """
+    started = time.perf_counter()
+    first_timestamp = None
+    timestamp = None
+    fused = 0
+    for timestamp, source, payload in recording.messages(start, stop):
+        if first_timestamp is None:
+            first_timestamp = timestamp
+        _pace(timestamp, first_timestamp, started, speed)
+
+        if source == 'udp':
+            station._handle_datagram(bytes(payload))
+        elif is_binary(payload):
+            msg_type, body = decode_message(bytes(payload))
+            if msg_type not in (MSG_PING, MSG_PONG):
+                station._handle_message(source, msg_type, body)
+        else:
+            station._store_report(source, json.loads(bytes(payload)))
+        fused += station._fuse_due(timestamp, print_data)
+
+    if timestamp is not None:
+        fused += station._fuse_due(np.inf, print_data)
+    return fused
@@ -0,0 +1,87 @@
+import numpy as np
+
+# Worst-case interpolation bias for a Hann-windowed tone, in bins
+INTERPOLATION_BIAS_BINS = {
+    'parabolic': 0.053,
+    'gaussian': 0.016,
+}
+
+def interpolate_peak(fft_data, peak_idx, method='gaussian'):
+    """
+    Sub-bin peak position from the peak bin and its two neighbours.
+
+    'parabolic' fits a parabola to the linear magnitude. 'gaussian' fits it to the log
+    magnitude (quadratic-log interpolation), which is exact for a Gaussian peak and close
+    to exact for a Hann window.
+
+    Args:
+        fft_data (ndarray): [..., n_bins] complex spectrum or magnitude
+        peak_idx (ndarray or int): Index of the peak bin for each spectrum
+        method (str): 'parabolic' or 'gaussian'
+    Returns:
+        ndarray: Fractional bin index of the peak (same shape as peak_idx)
+    """
+    if method not in INTERPOLATION_BIAS_BINS:
+        raise ValueError(f"method must be one of {list(INTERPOLATION_BIAS_BINS)}")
+
+    mag = np.abs(fft_data)
+    n_bins = mag.shape[-1]
+    idx = np.clip(np.asarray(peak_idx), 1, n_bins - 2)
+    neighbours = idx[..., None] + np.array([-1, 0, 1])
+    if mag.ndim == 1:
+        values = mag[neighbours]
+    else:
+        # Allows several peaks per spectrum: idx may have one more axis than mag's leading axes
+        flat = neighbours.reshape(mag.shape[:-1] + (-1,))
+        values = np.take_along_axis(mag, flat, axis=-1).reshape(neighbours.shape)
+    a, b, c = np.moveaxis(values, -1, 0)
+
+    if method == 'gaussian':
+        a, b, c = np.log(a + 1e-20), np.log(b + 1e-20), np.log(c + 1e-20)
+
+    denom = a - 2 * b + c
+    safe = np.where(denom == 0, 1.0, denom)
+    delta = np.where(denom == 0, 0.0, 0.5 * (a - c) / safe)
+    return idx + np.clip(delta, -0.5, 0.5)
+
+def frequency_uncertainty(peak_power, noise_power, n_samples, sample_rate, bias_bins=0.0):
+    """
+    One-sigma frequency uncertainty in Hz for a Hann-windowed tone.
+
+    Combines the Cramer-Rao bound for a single tone in white noise with the
+    interpolator's worst-case bias.
+
+    Args:
+        peak_power (ndarray): |X|^2 at the peak bin
+        noise_power (ndarray): Mean |X|^2 of a noise-only bin
+        n_samples (int): Frame length in samples
+        sample_rate (float): Sample rate in Hz
+        bias_bins (float): Interpolator bias bound in bins
+    """
+    # Hann peak bin SNR is N/3 times the per-sample SNR A^2 / (2 sigma^2) of a real tone,
+    # for which var(omega) >= 12 / (SNR N (N^2 - 1)) (Kay; 6 would be the complex-tone form)
+    sample_snr = np.maximum(3 * peak_power / (noise_power * n_samples), 1e-12)
+    crlb = sample_rate / (2 * np.pi) * np.sqrt(12 / (sample_snr * n_samples * (n_samples**2 - 1)))
+    bias = bias_bins * sample_rate / n_samples
+    return np.sqrt(crlb**2 + bias**2)
+
+def zoom_peak(audio_data, window, center_freq, sample_rate, span_bins=2.0, n_points=64):
+    """
+    Refine a peak with a zoom FFT (chirp-z transform) around center_freq.
+
+    Evaluates the windowed spectrum on n_points over +/- span_bins/2 FFT bins and then
+    interpolates on that fine grid, giving sub-hundredth-bin resolution without
+    lengthening the frame.
+
+    Returns:
+        tuple: (refined frequency Hz, zoom grid spacing Hz)
+    """
+    from scipy.signal import zoom_fft  # Slow to import; only zoom refinement needs it
+    n = len(audio_data)
+    bin_width = sample_rate / n
+    f1 = center_freq - 0.5 * span_bins * bin_width
+    f2 = center_freq + 0.5 * span_bins * bin_width
+    zoomed = zoom_fft(audio_data * window, [f1, f2], m=n_points, fs=sample_rate, endpoint=True)
+    step = (f2 - f1) / (n_points - 1)
+    fine_idx = interpolate_peak(zoomed, int(np.argmax(np.abs(zoomed))), method='gaussian')
+    return float(f1 + fine_idx * step), step
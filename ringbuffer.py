@@ -0,0 +1,83 @@
+import numpy as np
+
+class RingBuffer:
+    """
+    Preallocated single-producer / single-consumer audio ring buffer.
+
+    The sounddevice callback writes blocks with push() and the processing loop
+    reads overlapping frames with read_frame(). The writer only advances
+    write_pos and the reader only advances read_pos, so no lock is needed.
+    If the reader falls more than `capacity` samples behind, incoming samples
+    that do not fit are dropped and counted instead of overwriting unread data.
+
+    Multi-channel audio is stored as [channels, capacity] so frames come out in
+    the [channels, samples] layout used for processing.
+    """
+    def __init__(self, capacity, channels=1, dtype=np.float32):
+        self.capacity = int(capacity)
+        self.channels = channels
+        self.buffer = np.zeros((channels, self.capacity), dtype=dtype)
+        # Total samples written / consumed since creation (never wrapped)
+        self.write_pos = 0
+        self.read_pos = 0
+        self.overflows = 0        # Number of push() calls that had to drop samples
+        self.dropped_samples = 0  # Total samples dropped on overflow
+
+    def available(self):
+        """Number of unread samples"""
+        return self.write_pos - self.read_pos
+
+    def push(self, samples):
+        """
+        Append a block of samples (called from the audio callback).
+
+        Args:
+            samples (ndarray): [frames] or [frames, channels] as delivered by sounddevice
+        """
+        n = len(samples)
+        free = self.capacity - (self.write_pos - self.read_pos)
+        if n > free:
+            self.overflows += 1
+            self.dropped_samples += n - free
+            n = free
+            if n == 0:
+                return
+
+        start = self.write_pos % self.capacity
+        first = min(n, self.capacity - start)
+        self.buffer[:, start:start + first] = samples[:first].T
+        if first < n:
+            self.buffer[:, :n - first] = samples[first:n].T
+
+        # Publish only after the data is in place
+        self.write_pos += n
+
+    def read_frame(self, out, hop):
+        """
+        Copy the next frame into `out` and advance the read position by `hop`.
+
+        Args:
+            out (ndarray): Preallocated [frame_size] (mono) or [channels, frame_size] frame buffer
+            hop (int): Samples to advance after reading (hop < len(out) gives overlapping frames)
+        Returns:
+            bool: False if a full frame is not available yet
+        """
+        frame_size = out.shape[-1]
+        if self.write_pos - self.read_pos < frame_size:
+            return False
+
+        start = self.read_pos % self.capacity
+        first = min(frame_size, self.capacity - start)
+        out[..., :first] = self.buffer[:, start:start + first]
+        if first < frame_size:
+            out[..., first:] = self.buffer[:, :frame_size - first]
+
+        self.read_pos += hop
+        return True
+
+    def frames_available(self, frame_size, hop):
+        """Number of complete frames that can be read right now"""
+        available = self.write_pos - self.read_pos
+        if available < frame_size:
+            return 0
+        return (available - frame_size) // hop + 1
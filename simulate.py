@@ -0,0 +1,226 @@
+import time
+import socket
+import numpy as np
+from atmosphere import air_absorption
+from doppler import SPEED_OF_SOUND
+from protocol import encode_hello
+from filter import load_reference_spectra
+
+class Simulator:
+    """
+    Synthetic microphone audio for N drones on constant-velocity tracks over M ground stations.
+
+    Each drone emits a rotor fundamental and its harmonics. A station hears every component
+    at the time it was emitted, tau = t - |p(tau) - station| / c, so propagation delay and
+    Doppler shift both come from the phase. Amplitudes fall off with inverse-square spreading
+    plus atmosphere.air_absorption, and white noise is added. All stations, drones and
+    harmonics are generated in one vectorized pass per block.
+    """
+    def __init__(self, stations, drone_positions, drone_velocities, fundamentals, n_harmonics=5,
+                 sample_rate=44100, amplitude=0.1, reference_distance=2.0, noise_std=1e-3,
+                 temperature=20.0, humidity=50.0, reference_file='fft_amplitudes_1.csv',
+                 c=SPEED_OF_SOUND, seed=None):
+        """
+        Args:
+            stations (array-like): [M, 2] or [M, 3] microphone positions in meters
+            drone_positions (array-like): [N, 3] drone positions (x, y, height) at t = 0
+            drone_velocities (array-like): [N, 3] drone velocities in m/s
+            fundamentals (array-like): [N] rotor fundamentals in Hz
+            n_harmonics (int): Harmonics per drone (including the fundamental)
+            sample_rate (int): Audio sample rate in Hz
+            amplitude (float): Fundamental amplitude at reference_distance
+            reference_distance (float): Distance of `amplitude` in meters
+            noise_std (float): Standard deviation of the additive white noise
+            temperature (float): Air temperature in deg C (absorption)
+            humidity (float): Relative humidity in % (absorption)
+            reference_file (str): Measured drone spectrum (see filter.py) used to weight the
+                                  harmonics; 1/h weights are used if it cannot be read
+            c (float): Speed of sound in m/s
+            seed (int): Noise and phase random seed
+        """
+        stations = np.asarray(stations, dtype=float)
+        if stations.shape[1] == 2:
+            stations = np.column_stack([stations, np.zeros(len(stations))])
+        self.stations = stations
+        self.drone_positions = np.asarray(drone_positions, dtype=float).reshape(-1, 3)
+        self.drone_velocities = np.asarray(drone_velocities, dtype=float).reshape(-1, 3)
+        self.fundamentals = np.asarray(fundamentals, dtype=float).reshape(-1)
+        self.sample_rate = sample_rate
+        self.reference_distance = reference_distance
+        self.noise_std = noise_std
+        self.c = c
+        self.rng = np.random.default_rng(seed)
+
+        # [N, H] harmonic frequencies, amplitudes at the reference distance and absorption in dB/m
+        self.frequencies = self.fundamentals[:, None] * np.arange(1, n_harmonics + 1)
+        self.amplitudes = amplitude * self._harmonic_weights(reference_file)
+        self.absorption = air_absorption(self.frequencies, temperature, humidity) / 1000
+        self.phases = self.rng.uniform(0, 2 * np.pi, self.frequencies.shape)
+        self._sin_phases, self._cos_phases = np.sin(self.phases), np.cos(self.phases)
+
+    def _harmonic_weights(self, reference_file):
+        """Relative harmonic amplitudes from the measured spectrum at the reference distance"""
+        harmonics = np.arange(1, self.frequencies.shape[1] + 1)
+        try:
+            distances, bin_freqs, spectra = load_reference_spectra(reference_file)
+        except OSError:
+            return np.broadcast_to(1.0 / harmonics, self.frequencies.shape).copy()
+        spectrum = spectra[int(np.argmin(np.abs(distances - self.reference_distance)))]
+        weights = np.interp(self.frequencies, bin_freqs, spectrum)
+        return weights / np.maximum(weights[:, :1], 1e-20)
+
+    def positions(self, t):
+        """[N, 3] drone positions at time t"""
+        return self.drone_positions + self.drone_velocities * t
+
+    def block(self, t0, n_samples):
+        """
+        Audio of every station for n_samples starting at time t0.
+
+        Returns:
+            ndarray: [M, n_samples] float32 samples
+        """
+        offsets = self.drone_positions[None] - self.stations[:, None]  # [M, N, 3]
+        a = np.sum(offsets**2, axis=-1)[..., None]
+        b = np.sum(offsets * self.drone_velocities[None], axis=-1)[..., None]
+        v2 = np.sum(self.drone_velocities**2, axis=-1)[None, :, None]
+
+        def delay(t):
+            """Propagation delay of sound heard at time t: two fixed-point steps of d = r(t - d) / c"""
+            d = np.sqrt(a + 2 * b * t + v2 * t**2) / self.c
+            tau = t - d
+            return np.sqrt(a + 2 * b * tau + v2 * tau**2) / self.c
+
+        # The delay is smooth over a block, so solve it exactly at the start, middle and end
+        # and interpolate quadratically between them
+        duration = n_samples / self.sample_rate
+        knots = delay(t0 + np.array([0.0, 0.5, 1.0]) * duration)  # [M, N, 3]
+        x = np.arange(n_samples) / n_samples
+        basis = np.stack([2 * (x - 0.5) * (x - 1), -4 * x * (x - 1), 2 * x * (x - 0.5)])  # [3, T]
+        delays = knots @ basis  # [M, N, T]
+
+        # Spreading and absorption change little within a block; evaluate them at its middle
+        r = np.maximum(self.c * knots[..., 1], 0.1)  # [M, N]
+        gain = (self.reference_distance / r)[..., None] * 10 ** (-self.absorption[None] * r[..., None] / 20)
+        weights = self.amplitudes[None] * gain  # [M, N, H]
+
+        # Phase of the fundamental at the emission time, wrapped to one cycle in float64 so
+        # float32 is accurate enough after it
+        emitted = self.fundamentals[:, None] * (t0 + np.arange(n_samples) / self.sample_rate)
+        cycles = (emitted - np.floor(emitted))[None] - self.fundamentals[None, :, None] * delays
+        cycles -= np.floor(cycles)
+        theta = (2 * np.pi * cycles).astype(np.float32)
+
+        # Harmonics h*theta by the Chebyshev recurrence, so only one sin/cos pair is evaluated
+        sin_1, cos_1 = np.sin(theta), np.cos(theta)
+        twice_cos = 2 * cos_1
+        sin_h, cos_h = sin_1, cos_1
+        sin_prev, cos_prev = np.float32(0.0), np.float32(1.0)
+        audio = self.noise_std * self.rng.standard_normal((len(self.stations), n_samples), dtype=np.float32)
+        for h in range(self.frequencies.shape[1]):
+            # sin(h theta + phase) = sin(h theta) cos(phase) + cos(h theta) sin(phase)
+            cos_weights = (weights[..., h] * self._cos_phases[None, :, h]).astype(np.float32)
+            sin_weights = (weights[..., h] * self._sin_phases[None, :, h]).astype(np.float32)
+            audio += np.einsum('mn,mnt->mt', cos_weights, sin_h) + np.einsum('mn,mnt->mt', sin_weights, cos_h)
+            sin_h, sin_prev = twice_cos * sin_h - sin_prev, sin_h
+            cos_h, cos_prev = twice_cos * cos_h - cos_prev, cos_h
+        return audio
+
+    def observed_frequencies(self, t):
+        """
+        Doppler-shifted fundamentals heard at every station at time t (same convention as doppler.doppler_shift).
+
+        Returns:
+            ndarray: [M, N] frequencies in Hz
+        """
+        offsets = self.stations[:, None] - self.positions(t)[None]  # [M, N, 3] drone -> station
+        v_parallel = np.sum(self.drone_velocities[None] * offsets, axis=-1) / np.linalg.norm(offsets, axis=-1)
+        return self.fundamentals[None] * self.c / (self.c - v_parallel)
+
+    def stream(self, block_size, duration=None):
+        """
+        Yields:
+            tuple: (block start time, [M, block_size] audio) until `duration` seconds (forever if None)
+        """
+        t = 0.0
+        while duration is None or t < duration:
+            yield t, self.block(t, block_size)
+            t += block_size / self.sample_rate
+
+def feed(processor, samples, capture_time):
+    """Push one simulated block into an AudioProcessor as if it came from its audio callback"""
+    processor.clock_anchor = (processor.ring.write_pos, capture_time)
+    processor.ring.push(samples)
+
+def run_virtual_stations(simulator, host='127.0.0.1', port=58392, duration=10.0, speed=1.0,
+                         block_seconds=0.05, **station_kwargs):
+    """
+    Run one virtual sender per simulated station against a receiver, all from this thread.
+
+    Every station gets its own AudioProcessor and report pipeline (GroundStation in sender
+    mode), so the receiver sees the same messages as from real hardware. Capture times are
+    the wall-clock start plus simulated time, so fusion on the receiver lines up only at speed=1.
+
+    Args:
+        simulator (Simulator): Scenario to play
+        host, port: Receiver address
+        duration (float): Simulated seconds to run
+        speed (float): Multiple of real time (None = as fast as possible)
+        block_seconds (float): Audio block length fed per step
+        station_kwargs: Extra GroundStation arguments for every virtual station (protocol, transport, gating, ...)
+    Returns:
+        int: Number of reports sent
+    """
+    from ground import GroundStation
+
+    senders = []
+    for m, location in enumerate(simulator.stations[:, :2]):
+        sender = GroundStation('sender', host=host, port=port, location=tuple(location), name=f'sim{m}',
+                               **station_kwargs)
+        sender.socket = socket.create_connection((host, port), timeout=5.0)
+        if sender.transport == 'udp':
+            sender.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if sender.protocol == 'binary':
+            sender._send_message(encode_hello(sender._station_metadata()))
+        sender._sync_clock()
+        senders.append(sender)
+
+    block_size = int(block_seconds * simulator.sample_rate)
+    sent = 0
+    start = time.time()
+    try:
+        for t, audio in simulator.stream(block_size, duration):
+            for sender, samples in zip(senders, audio):
+                processor = sender.audio_processor
+                feed(processor, samples, start + t)
+                peak_freq, peak_power, target_power_dB = processor._update_stream(plot=False)
+                if peak_freq is None:
+                    continue
+                report = sender._report(start + t, peak_freq, peak_power, target_power_dB)
+                if not sender.gating or sender._gate_open(report):
+                    sender._send_reports([report])
+                    sent += 1
+                elif time.time() - sender._last_send_time >= sender.heartbeat_interval:
+                    sender._send_heartbeat(report)
+            if speed:
+                delay = start + (t + block_size / simulator.sample_rate) / speed - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+    finally:
+        for sender in senders:
+            sender.socket.close()
+            if sender.udp_socket is not None:
+                sender.udp_socket.close()
+    return sent
+
+if __name__ == "__main__":
+    # 10 x 10 grid of stations 10 m apart with two drones crossing it
+    xs, ys = np.meshgrid(np.arange(10) * 10.0, np.arange(10) * 10.0)
+    stations = np.column_stack([xs.ravel(), ys.ravel()])
+    simulator = Simulator(stations,
+                          drone_positions=[[0, 20, 10], [90, 70, 15]],
+                          drone_velocities=[[5, 1, 0], [-4, -2, 0]],
+                          fundamentals=[620, 880], seed=0)
+    # Start a receiver (GroundStation('receiver', ...)) on this machine first
+    sent = run_virtual_stations(simulator, host='127.0.0.1', port=58392, duration=30.0)
+    print(f"Sent {sent} reports from {len(stations)} virtual stations")
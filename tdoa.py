@@ -0,0 +1,309 @@
+import numpy as np
+from scipy.fft import rfft, irfft
+from scipy.ndimage import maximum_filter1d
+from refine import interpolate_peak
+
+SPEED_OF_SOUND = 343  # m/s
+
+def spectral_snapshot(audio_data, sample_rate, freq_min, freq_max):
+    """
+    Compact band-limited spectrum of one frame for GCC-PHAT on the receiver.
+
+    The frame is Hann-windowed, so the leakage of strong rotor lines (whose cross-phase
+    carries the line's phase rather than the delay and pulls GCC-PHAT toward zero lag) stays
+    next to the lines, then zero-padded to twice its length so the receiver's
+    cross-correlation is linear rather than circular. Only the bins in [freq_min, freq_max]
+    are kept.
+
+    Returns:
+        tuple: (start_bin, n_fft, complex64 spectrum of the band bins)
+    """
+    n_fft = 2 * len(audio_data)
+    start_bin = int(np.ceil(freq_min * n_fft / sample_rate))
+    stop_bin = min(int(np.floor(freq_max * n_fft / sample_rate)) + 1, n_fft // 2 + 1)
+    spectrum = rfft(audio_data * np.hanning(len(audio_data)), n=n_fft)[start_bin:stop_bin]
+    return start_bin, n_fft, spectrum.astype(np.complex64)
+
+def station_pairs(n_stations):
+    """Index arrays (i, j) of every unordered station pair"""
+    return np.triu_indices(n_stations, k=1)
+
+def cross_correlations(spectra, start_bin, n_fft, pairs=None):
+    """
+    GCC-PHAT cross-correlations of station pairs in one vectorized pass.
+
+    Args:
+        spectra (ndarray): [n_stations, n_band] band spectra from spectral_snapshot
+        start_bin (int): FFT bin of the first band bin
+        n_fft (int): FFT length used for the snapshots
+        pairs (tuple): (i, j) index arrays, defaults to every pair
+    Returns:
+        tuple: (i, j, cc) where cc[p] is the [n_fft] correlation of pair p; lag k (arrival at i
+               minus arrival at j, in samples) is at index k mod n_fft
+    """
+    i, j = station_pairs(len(spectra)) if pairs is None else pairs
+    cross = spectra[i] * np.conj(spectra[j])
+    cross /= np.abs(cross) + 1e-12  # PHAT weighting
+
+    full = np.zeros((len(i), n_fft // 2 + 1), dtype=np.complex128)
+    full[:, start_bin:start_bin + spectra.shape[1]] = cross
+    return i, j, irfft(full, n=n_fft, axis=-1, workers=-1)
+
+def _peak_lags(cc, centers, half_widths):
+    """
+    Interpolated correlation peak of every pair inside its own lag window.
+
+    Args:
+        cc (ndarray): [n_pairs, n_fft] correlations from cross_correlations
+        centers, half_widths (ndarray): [n_pairs] window center and half-width in samples
+    Returns:
+        ndarray: [n_pairs] peak lags in (fractional) samples
+    """
+    max_width = int(np.max(half_widths))
+    offsets = np.arange(-max_width, max_width + 1)
+    lags = np.rint(centers).astype(int)[:, None] + offsets
+    window = np.take_along_axis(cc, lags % cc.shape[1], axis=-1)
+    window[np.abs(offsets)[None] > half_widths[:, None]] = -np.inf
+    peak = np.argmax(window, axis=-1)
+    frac = interpolate_peak(np.maximum(np.where(np.isfinite(window), window, 0), 0), peak, method='parabolic')
+    return lags[:, 0] + frac
+
+def gcc_phat(spectra, start_bin, n_fft, sample_rate, max_delay=None, pairs=None):
+    """
+    GCC-PHAT time delays between all station pairs in one vectorized pass.
+
+    Args:
+        spectra (ndarray): [n_stations, n_band] band spectra from spectral_snapshot
+        start_bin (int): FFT bin of the first band bin
+        n_fft (int): FFT length used for the snapshots
+        sample_rate (float): Sample rate in Hz
+        max_delay (float): Largest physically possible delay in seconds (limits the lag search)
+        pairs (tuple): (i, j) index arrays, defaults to every pair
+    Returns:
+        tuple: (i, j, delays) where delays[p] is the arrival time at i minus arrival time at j
+               relative to each snapshot's start, in seconds
+    """
+    i, j, cc = cross_correlations(spectra, start_bin, n_fft, pairs)
+    max_lag = n_fft // 2 - 1
+    if max_delay is not None:
+        max_lag = min(max_lag, int(np.ceil(max_delay * sample_rate)) + 1)
+    lags = _peak_lags(cc, np.zeros(len(i)), np.full(len(i), max_lag))
+    return i, j, lags / sample_rate
+
+def multilaterate(positions, i, j, range_differences, weights=None, initial_guess=None, iterations=10):
+    """
+    Hyperbolic multilateration by damped Gauss-Newton.
+
+    Solves for the point x minimizing sum w * (|x - p_i| - |x - p_j| - d_ij)^2.
+
+    Args:
+        positions (ndarray): [n_stations, 2] station coordinates
+        i, j (ndarray): Station index of each pair
+        range_differences (ndarray): c * TDOA for each pair in meters
+        weights (ndarray): Optional per-pair weights
+        initial_guess (array-like): Starting point, defaults to the station centroid
+    Returns:
+        tuple: (estimated (x, y), [2, 2] covariance scaled by the residual variance)
+    """
+    positions = np.asarray(positions, dtype=float)
+    w = np.ones(len(i)) if weights is None else np.asarray(weights, dtype=float)
+    x = positions.mean(axis=0) if initial_guess is None else np.array(initial_guess, dtype=float)
+    damping = 1e-3
+
+    def cost(point):
+        ranges = np.linalg.norm(point - positions, axis=1) + 1e-9
+        residual = ranges[i] - ranges[j] - range_differences
+        return np.sum(w * residual**2), ranges, residual
+
+    current, ranges, residual = cost(x)
+    for _ in range(iterations):
+        units = (x - positions) / ranges[:, None]
+        jac = units[i] - units[j]  # [n_pairs, 2]
+        jtw = jac.T * w
+        step = np.linalg.solve(jtw @ jac + damping * np.eye(2), -jtw @ residual)
+        candidate = x + step
+        new, new_ranges, new_residual = cost(candidate)
+        if new < current:
+            x, current, ranges, residual = candidate, new, new_ranges, new_residual
+            damping *= 0.3
+            if np.linalg.norm(step) < 1e-4:
+                break
+        else:
+            damping *= 10
+
+    units = (x - positions) / ranges[:, None]
+    jac = units[i] - units[j]
+    dof = len(i) - 2
+    sigma2 = current / dof if dof > 0 else 1.0
+    covariance = sigma2 * np.linalg.pinv((jac.T * w) @ jac)
+    return x, covariance
+
+def _steered_response(cc, lags, width, max_lag, min_pairs=3):
+    """
+    Mean over the usable pairs of the correlations, each max-filtered over +/- width samples,
+    at the given lags.
+
+    Only pairs whose lag is within max_lag (snapshots overlapping enough) are usable, and points
+    with fewer than min_pairs of them score 0; the mean keeps points heard by many pairs from
+    outscoring ones heard by few. With a cell's centre lags and a width covering every lag
+    inside the cell, the result is an upper bound of the response anywhere in the cell.
+
+    Args:
+        cc (ndarray): [n_pairs, n_fft] correlations
+        lags (ndarray): [n_points, n_pairs] lags in samples
+        width (int): Max-filter half-width in samples
+        max_lag (float): Largest usable lag in samples
+        min_pairs (int): Fewest usable pairs for a nonzero response
+    """
+    filtered = maximum_filter1d(cc, 2 * width + 1, axis=-1, mode='wrap') if width > 0 else cc
+    index = np.rint(lags).astype(int) % cc.shape[1]
+    response = filtered[np.arange(cc.shape[0]), index]
+    # Pairs usable somewhere in the cell, and pairs usable everywhere in it
+    usable = np.abs(lags) <= max_lag + width
+    certain = np.sum(np.abs(lags) <= max_lag - width, axis=-1)
+    total = np.sum(np.where(usable, np.maximum(response, 0.0), 0.0), axis=-1)
+    return np.where(np.sum(usable, axis=-1) >= min_pairs, total / np.maximum(certain, min_pairs), 0.0)
+
+def tdoa_localize(spectra, positions, capture_times, start_bin, n_fft, sample_rate, c=SPEED_OF_SOUND,
+                  search_margin=None, min_overlap=0.5, ambiguity_ratio=0.8, ambiguity_distance=1.0,
+                  max_residual=0.5, min_spacing=0.1, n_candidates=256):
+    """
+    Locate a source from time-aligned spectral snapshots of several stations.
+
+    Every pair's lag is limited to what the geometry allows: the arrival-time difference is at
+    most the pair's separation over c, shifted by the difference of the capture times. A pair
+    only counts at lags where its snapshots share at least min_overlap of a frame, and pairs
+    with no such lag inside their geometric window are dropped. The
+    position is found jointly by maximizing the steered response (the pairs' GCC-PHAT averaged
+    at the lags a point implies) by branch and bound over a grid around the stations; the
+    cells kept at min_spacing are scored on a sub-grid whose lags step by about one sample,
+    and the best point is refined by multilateration of the pairs' peaks next to it. A
+    periodic rotor comb gives
+    peaks one period apart, so fixes are rejected (None) when a point at least
+    ambiguity_distance away scores nearly as high, when the multilateration residual is too
+    large, or when the fix leaves the search area.
+
+    Args:
+        spectra (ndarray): [n_stations, n_band] snapshots
+        positions (ndarray): [n_stations, 2] station coordinates
+        capture_times (ndarray): Capture time of each snapshot's first sample (synchronized clocks)
+        start_bin, n_fft, sample_rate: Snapshot parameters from spectral_snapshot
+        search_margin (float): Search area beyond the stations' bounding box in meters
+                               (default: the largest station separation)
+        min_overlap (float): Smallest shared fraction of two snapshots for their pair to be used
+        ambiguity_ratio (float): Reject if a distant point reaches this fraction of the best response
+        ambiguity_distance (float): Separation in meters beyond which a point counts as distant
+        max_residual (float): Largest RMS range-difference residual of the fix in meters
+        min_spacing (float): Finest grid spacing in meters
+        n_candidates (int): Grid cells kept per refinement level
+    Returns:
+        tuple: (estimated (x, y), [2, 2] position covariance, per-pair arrival-time differences in
+               seconds), or None when too few pairs overlap or the fix is ambiguous or inconsistent
+    """
+    positions = np.asarray(positions, dtype=float)
+    capture_times = np.asarray(capture_times, dtype=float)
+    spectra = np.asarray(spectra)
+    frame = n_fft // 2
+
+    # Keep the pairs whose snapshots can overlap enough at some geometrically possible lag
+    i, j = station_pairs(len(positions))
+    separation = np.linalg.norm(positions[i] - positions[j], axis=1)
+    shift = (capture_times[i] - capture_times[j]) * sample_rate  # Snapshot offset in samples
+    max_lag = (1 - min_overlap) * frame
+    usable = np.abs(shift) - separation / c * sample_rate <= max_lag
+    i, j, shift = i[usable], j[usable], shift[usable]
+    if len(i) < 3 or len(np.union1d(i, j)) < 3:
+        return None
+    _, _, cc = cross_correlations(spectra, start_bin, n_fft, (i, j))
+
+    # Steered response of grid points: point x implies lag (|x - p_i| - |x - p_j|) / c - offset
+    def lags_at(points):
+        ranges = np.linalg.norm(points[:, None] - positions[None], axis=-1)
+        return (ranges[:, i] - ranges[:, j]) / c * sample_rate - shift
+
+    margin = np.max(separation) if search_margin is None else search_margin
+    lower = positions.min(axis=0) - margin
+    upper = positions.max(axis=0) + margin
+    spacing = max(np.max(upper - lower) / 32, min_spacing)
+    axes = [np.arange(lo + spacing / 2, hi, spacing) for lo, hi in zip(lower, upper)]
+    cells = np.stack(np.meshgrid(*axes), axis=-1).reshape(-1, 2)
+    children = (np.stack(np.meshgrid(np.arange(4), np.arange(4)), axis=-1).reshape(-1, 2) - 1.5) / 4
+
+    # Branch and bound: a cell's bound covers every lag its points can take (the lag of a pair
+    # changes by at most 2 / c per meter), so the best cells are refined until min_spacing
+    while True:
+        width = int(np.ceil(np.sqrt(2) * spacing / c * sample_rate))
+        bounds = _steered_response(cc, lags_at(cells), width, max_lag)
+        keep = np.argsort(bounds)[::-1][:n_candidates]
+        cells, bounds = cells[keep], bounds[keep]
+        if spacing <= min_spacing:
+            break
+        cells = (cells[:, None] + children[None] * spacing).reshape(-1, 2)
+        spacing /= 4
+
+    # Response of the kept cells on a sub-grid whose lags step by about one sample
+    steps = (np.arange(width) + 0.5) / width - 0.5
+    offsets = np.stack(np.meshgrid(steps, steps), axis=-1).reshape(-1, 2) * spacing
+    points = (cells[:, None] + offsets[None]).reshape(-1, 2)
+    scores = _steered_response(cc, lags_at(points), 1, max_lag)
+    best = points[np.argmax(scores)]
+    distant = np.linalg.norm(points - best, axis=1) >= ambiguity_distance
+    if np.any(distant) and np.max(scores[distant]) >= ambiguity_ratio * np.max(scores):
+        return None  # Several points explain the correlations (e.g. one comb period apart)
+
+    # Peaks next to the lags of the best cell (pairs that overlap there), then multilateration from it
+    expected = lags_at(best[None])[0]
+    overlapping = np.abs(expected) <= max_lag
+    i, j, shift, cc, expected = i[overlapping], j[overlapping], shift[overlapping], cc[overlapping], expected[overlapping]
+    if len(i) < 3 or len(np.union1d(i, j)) < 3:
+        return None
+    tdoa = (_peak_lags(cc, expected, np.full(len(i), width + 1)) + shift) / sample_rate
+    target, covariance = multilaterate(positions, i, j, c * tdoa, initial_guess=best)
+    ranges = np.linalg.norm(target - positions, axis=1)
+    residual = np.sqrt(np.mean((ranges[i] - ranges[j] - c * tdoa)**2))
+    if residual > max_residual or np.any(target < lower) or np.any(target > upper):
+        return None
+    return target, covariance, tdoa
+
+if __name__ == "__main__":
+    # Self-check: a broadband source is located from overlapping snapshots; a pure rotor comb
+    # (ambiguous one period apart) and snapshots that do not overlap give no fix
+    from simulate import Simulator
+    sample_rate, frame = 44100, 4410
+    stations = np.array([[0, 0], [30, 0], [0, 30], [30, 30]], dtype=float)
+    rng = np.random.default_rng(0)
+    source = rng.standard_normal(1 << 16)
+    source_fft = np.fft.rfft(source)
+    omega = 2 * np.pi * np.fft.rfftfreq(len(source), 1 / sample_rate)
+
+    def localize(frames, capture_times):
+        snapshots = [spectral_snapshot(f, sample_rate, 500, 10000) for f in frames]
+        return tdoa_localize(np.stack([s[2] for s in snapshots]), stations, capture_times,
+                             snapshots[0][0], snapshots[0][1], sample_rate)
+
+    def broadband(target, capture_times, snr=1.0):
+        frames = []
+        for station, t0 in zip(stations, capture_times):
+            r = np.linalg.norm(np.asarray(target) - station)
+            x = np.fft.irfft(source_fft * np.exp(-1j * omega * r / SPEED_OF_SOUND), n=len(source)) / r
+            k = int(round(t0 * sample_rate))
+            frames.append(x[k:k + frame] + rng.standard_normal(frame) * np.std(x) / snr)
+        return localize(frames, capture_times)
+
+    for target in ((15, 14), (5, 20), (25, 8)):
+        capture_times = np.round((0.5 + rng.uniform(0, 0.03, 4)) * sample_rate) / sample_rate
+        result = broadband(target, capture_times)
+        print(f"Broadband source at {target}: {None if result is None else np.round(result[0], 2)}")
+        assert result is not None and np.linalg.norm(result[0] - target) < 0.1
+
+    result = broadband((15, 14), 0.2 + np.array([0, 0.3, 0.6, 0.9]))
+    print(f"Snapshots without overlap: {result}")
+    assert result is None
+
+    for target in ((15, 14), (5, 20)):
+        simulator = Simulator(stations, [[*target, 0]], [[0, 0, 0]], [620], seed=0)
+        capture_times = 1.0 + rng.uniform(0, 0.03, 4)
+        frames = [simulator.block(t0, frame)[m] for m, t0 in enumerate(capture_times)]
+        result = localize(frames, capture_times)
+        print(f"Pure 620 Hz comb at {target}: {None if result is None else np.round(result[0], 2)}")
+        assert result is None
@@ -0,0 +1,269 @@
+import numpy as np
+
+class KalmanTracker:
+    """
+    Constant-velocity (or constant-turn) Kalman filter for a 2-D target.
+
+    State is [x, y, v_x, v_y]. Fixes from triangulation/TDOA are fused with their
+    covariance, and predict()/position_at() propagate the track between fixes so
+    consumers can be updated faster than measurements arrive. The filter matrices
+    and work buffers are preallocated and updated in place.
+    """
+    def __init__(self, process_noise=1.0, turn_rate=0.0, initial_velocity_std=10.0, gate=None):
+        """
+        Args:
+            process_noise (float): White-noise acceleration spectral density (m^2/s^3)
+            turn_rate (float): Constant turn rate in rad/s (0 = constant velocity)
+            initial_velocity_std (float): Velocity uncertainty when a track starts (m/s)
+            gate (float): Reject fixes whose normalized innovation squared exceeds this (None = no gating)
+        """
+        self.process_noise = process_noise
+        self.turn_rate = turn_rate
+        self.initial_velocity_std = initial_velocity_std
+        self.gate = gate
+
+        self.x = np.zeros(4)
+        self.P = np.eye(4)
+        self.initialized = False
+        self.timestamp = None
+
+        # Preallocated work matrices
+        self._F = np.eye(4)
+        self._Q = np.zeros((4, 4))
+        self._FP = np.empty((4, 4))
+        self._x_tmp = np.empty(4)
+        self._S = np.empty((2, 2))
+        self._S_inv = np.empty((2, 2))
+        self._K = np.empty((4, 2))
+        self._KHP = np.empty((4, 4))
+        self._y = np.empty(2)
+        self._dx = np.empty(4)
+
+    def reset(self):
+        """Drop the track"""
+        self.initialized = False
+        self.timestamp = None
+
+    def _set_transition(self, dt, F, Q):
+        """Fill F (identity outside the velocity columns) and Q in place for a step of dt seconds"""
+        w = self.turn_rate
+        if abs(w) < 1e-9:
+            s, c1, cos, sin = dt, 0.0, 1.0, 0.0
+        else:
+            sin, cos = np.sin(w * dt), np.cos(w * dt)
+            s, c1 = sin / w, (1 - cos) / w
+        F[0, 2], F[0, 3] = s, -c1
+        F[1, 2], F[1, 3] = c1, s
+        F[2, 2], F[2, 3] = cos, -sin
+        F[3, 2], F[3, 3] = sin, cos
+
+        # Discrete white-noise acceleration
+        q = self.process_noise
+        Q[0, 0] = Q[1, 1] = q * dt**3 / 3
+        Q[0, 2] = Q[2, 0] = Q[1, 3] = Q[3, 1] = q * dt**2 / 2
+        Q[2, 2] = Q[3, 3] = q * dt
+
+    def predict(self, timestamp):
+        """Propagate the state to `timestamp` (no-op for times at or before the last one)"""
+        if not self.initialized or timestamp <= self.timestamp:
+            return
+        self._set_transition(timestamp - self.timestamp, self._F, self._Q)
+        np.dot(self._F, self.x, out=self._x_tmp)
+        self.x[:] = self._x_tmp
+        np.dot(self._F, self.P, out=self._FP)
+        np.dot(self._FP, self._F.T, out=self.P)
+        self.P += self._Q
+        self.timestamp = timestamp
+
+    def innovation(self, z, R):
+        """
+        Innovation of a fix against the current (already predicted) state.
+
+        A singular innovation covariance (a fix and prediction both exact along some direction)
+        is inverted by pseudo-inverse instead of dividing by its zero determinant.
+
+        Returns:
+            tuple: (innovation [2], innovation covariance [2, 2], normalized innovation squared)
+        """
+        np.subtract(z, self.x[:2], out=self._y)
+        np.add(self.P[:2, :2], R, out=self._S)
+        a, b, c, d = self._S[0, 0], self._S[0, 1], self._S[1, 0], self._S[1, 1]
+        det = a * d - b * c
+        if det > 1e-12 * a * d:
+            self._S_inv[0, 0], self._S_inv[0, 1] = d / det, -b / det
+            self._S_inv[1, 0], self._S_inv[1, 1] = -c / det, a / det
+        else:
+            self._S_inv[:] = np.linalg.pinv(self._S)
+        nis = float(self._y @ self._S_inv @ self._y)
+        return self._y, self._S, nis
+
+    def update(self, z, R, timestamp):
+        """
+        Fuse a position fix.
+
+        Args:
+            z (array-like): Measured (x, y)
+            R (array-like): [2, 2] measurement covariance
+            timestamp (float): Measurement time in seconds
+        Returns:
+            float: Log-likelihood of the fix (0 for the fix that starts the track, -inf if gated out)
+        """
+        R = np.asarray(R, dtype=float)
+        if not self.initialized:
+            self.x[:2] = z
+            self.x[2:] = 0.0
+            self.P[:] = 0.0
+            self.P[:2, :2] = R
+            self.P[2, 2] = self.P[3, 3] = self.initial_velocity_std**2
+            self.timestamp = timestamp
+            self.initialized = True
+            return 0.0
+
+        self.predict(timestamp)
+        y, S, nis = self.innovation(z, R)
+        if self.gate is not None and nis > self.gate:
+            return -np.inf
+
+        # K = P H^T S^-1, x += K y, P -= K H P
+        np.dot(self.P[:, :2], self._S_inv, out=self._K)
+        np.dot(self._K, y, out=self._dx)
+        self.x += self._dx
+        np.dot(self._K, self.P[:2, :], out=self._KHP)
+        self.P -= self._KHP
+        # Keep P symmetric against round-off
+        self.P += self.P.T
+        self.P *= 0.5
+
+        det = max(S[0, 0] * S[1, 1] - S[0, 1] * S[1, 0], np.finfo(float).tiny)
+        return -0.5 * (nis + np.log(det) + 2 * np.log(2 * np.pi))
+
+    def position_at(self, timestamp):
+        """
+        Predicted (x, y) at `timestamp` without changing the filter state.
+
+        The transition is built in local arrays rather than the work matrices, so the plot
+        thread can call this while the receiver thread runs predict()/update().
+        """
+        if not self.initialized:
+            return None
+        dt = max(timestamp - self.timestamp, 0.0)
+        F = np.eye(4)
+        self._set_transition(dt, F, np.zeros((4, 4)))
+        return F[:2] @ self.x
+
+class IMMTracker:
+    """
+    Interacting multiple model tracker mixing constant-velocity and constant-turn filters.
+
+    Models are a constant-velocity filter plus left and right constant-turn filters at
+    +/- turn_rate, so the track follows both straight flight and turns without the lag
+    of a single high-noise filter.
+    """
+    def __init__(self, process_noise=1.0, turn_rate=0.5, switch_probability=0.05,
+                 initial_velocity_std=10.0, gate=None):
+        """
+        Args:
+            process_noise (float): White-noise acceleration spectral density for every model
+            turn_rate (float): Turn rate of the constant-turn models in rad/s
+            switch_probability (float): Probability of changing model between fixes
+            gate (float): Normalized innovation squared gate applied before fusing (None = no gating)
+        """
+        self.models = [KalmanTracker(process_noise, rate, initial_velocity_std, gate)
+                       for rate in (0.0, turn_rate, -turn_rate)]
+        n = len(self.models)
+        self.transition = np.full((n, n), switch_probability / (n - 1))
+        np.fill_diagonal(self.transition, 1 - switch_probability)
+        self.mu = np.array([0.8, 0.1, 0.1])
+
+        self.x = np.zeros(4)
+        self.P = np.eye(4)
+        self.initialized = False
+        self.timestamp = None
+
+        # Preallocated mixing buffers
+        self._states = np.zeros((n, 4))
+        self._covs = np.zeros((n, 4, 4))
+        self._mixed_x = np.zeros((n, 4))
+        self._mixed_P = np.zeros((n, 4, 4))
+        self._log_likelihood = np.zeros(n)
+
+    def reset(self):
+        """Drop the track"""
+        for model in self.models:
+            model.reset()
+        self.mu[:] = (0.8, 0.1, 0.1)
+        self.initialized = False
+        self.timestamp = None
+
+    def _combine(self):
+        """Update the combined state estimate from the model estimates and probabilities"""
+        for i, model in enumerate(self.models):
+            self._states[i] = model.x
+            self._covs[i] = model.P
+        np.dot(self.mu, self._states, out=self.x)
+        diff = self._states - self.x
+        self.P[:] = np.einsum('i,ijk->jk', self.mu, self._covs + diff[:, :, None] * diff[:, None, :])
+
+    def update(self, z, R, timestamp):
+        """
+        Fuse a position fix into every model and update the model probabilities.
+
+        Returns:
+            float: Combined log-likelihood of the fix (-inf if gated out)
+        """
+        if not self.initialized:
+            for model in self.models:
+                model.update(z, R, timestamp)
+            self._combine()
+            self.timestamp = timestamp
+            self.initialized = True
+            return 0.0
+
+        # Mixing step
+        predicted_mu = self.transition.T @ self.mu
+        mixing = self.transition * self.mu[:, None] / np.maximum(predicted_mu[None, :], 1e-300)
+        for i, model in enumerate(self.models):
+            self._states[i] = model.x
+            self._covs[i] = model.P
+        np.dot(mixing.T, self._states, out=self._mixed_x)
+        for j in range(len(self.models)):
+            diff = self._states - self._mixed_x[j]
+            self._mixed_P[j] = np.einsum('i,ijk->jk', mixing[:, j],
+                                         self._covs + diff[:, :, None] * diff[:, None, :])
+
+        # Model-matched filtering
+        for j, model in enumerate(self.models):
+            model.x[:] = self._mixed_x[j]
+            model.P[:] = self._mixed_P[j]
+            self._log_likelihood[j] = model.update(z, R, timestamp)
+
+        self.timestamp = timestamp
+        if np.all(np.isinf(self._log_likelihood)):
+            # Gated out by every model: keep the prediction only
+            self.mu[:] = predicted_mu
+            self._combine()
+            return -np.inf
+
+        # Model probability update
+        log_mu = np.log(np.maximum(predicted_mu, 1e-300)) + self._log_likelihood
+        log_mu -= log_mu.max()
+        self.mu[:] = np.exp(log_mu)
+        self.mu /= self.mu.sum()
+
+        self._combine()
+        return float(np.log(predicted_mu @ np.exp(self._log_likelihood)))
+
+    def predict(self, timestamp):
+        """Propagate every model to `timestamp`"""
+        if not self.initialized or timestamp <= self.timestamp:
+            return
+        for model in self.models:
+            model.predict(timestamp)
+        self._combine()
+        self.timestamp = timestamp
+
+    def position_at(self, timestamp):
+        """Probability-weighted predicted (x, y) at `timestamp` without changing the filter state"""
+        if not self.initialized:
+            return None
+        return sum(mu * model.position_at(timestamp) for mu, model in zip(self.mu, self.models))
@@ -1,43 +1,201 @@
 import numpy as np
-from scipy.optimize import minimize
 
-def triangulate_target(circles):
+def _initial_estimates(centers, radii, w):
+    """
+    Closed-form starting points from the linearized circle equations.
+
+    Subtracting the weighted mean circle equation from each circle gives the linear
+    system 2 (c_i - c_mean) . p = |c_i|^2 - mean|c|^2 - r_i^2 + mean r^2, solved for
+    every problem at once through its 2x2 normal equations.
+
+    When the geometry is degenerate (fewer than three circles or collinear centers)
+    the solution is ambiguous, so the weighted centroid is used together with a second
+    start offset perpendicular to the line of centers; the centroid alone would sit
+    on the symmetric saddle between the two mirror-image solutions.
+
+    Returns:
+        tuple: (starts [n, 2], alternate starts [n, 2], degenerate mask [n])
+    """
+    w_sum = np.maximum(w.sum(axis=1), 1e-12)
+    centroid = np.einsum('nk,nki->ni', w, centers) / w_sum[:, None]
+    sq_norm = np.sum(centers**2, axis=2)
+    mean_sq_norm = np.sum(w * sq_norm, axis=1) / w_sum
+    mean_sq_radius = np.sum(w * radii**2, axis=1) / w_sum
+
+    A = 2 * (centers - centroid[:, None, :])
+    b = sq_norm - mean_sq_norm[:, None] - radii**2 + mean_sq_radius[:, None]
+    Aw = A * w[..., None]
+    normal_matrix = np.einsum('nki,nkj->nij', Aw, A)
+    rhs = np.einsum('nki,nk->ni', Aw, b)
+
+    det = normal_matrix[:, 0, 0] * normal_matrix[:, 1, 1] - normal_matrix[:, 0, 1]**2
+    trace = normal_matrix[:, 0, 0] + normal_matrix[:, 1, 1]
+    degenerate = det <= 1e-9 * trace**2 + 1e-12
+    safe_det = np.where(degenerate, 1.0, det)
+    solution = np.stack([normal_matrix[:, 1, 1] * rhs[:, 0] - normal_matrix[:, 0, 1] * rhs[:, 1],
+                         normal_matrix[:, 0, 0] * rhs[:, 1] - normal_matrix[:, 0, 1] * rhs[:, 0]], axis=1) / safe_det[:, None]
+    starts = np.where(degenerate[:, None], centroid, solution)
+
+    # Smallest-eigenvalue direction of the center scatter is perpendicular to the line of centers
+    alternates = centroid.copy()
+    if degenerate.any():
+        _, eigenvectors = np.linalg.eigh(normal_matrix[degenerate])
+        offset = np.maximum(np.sqrt(mean_sq_radius[degenerate]), 1e-3)
+        alternates[degenerate] += offset[:, None] * eigenvectors[:, :, 0]
+    return starts, alternates, degenerate
+
+def _solve_2x2(hessian, gradient, damping):
+    """Damped Gauss-Newton steps -(H + damping * diag(H))^-1 g for a stack of 2x2 systems, zero if singular"""
+    h00 = hessian[:, 0, 0] * (1 + damping) + 1e-12
+    h11 = hessian[:, 1, 1] * (1 + damping) + 1e-12
+    h01 = hessian[:, 0, 1]
+    det = h00 * h11 - h01 * h01
+    scale = np.where(det > 0, -1.0 / np.where(det > 0, det, 1.0), 0.0)
+    step = np.empty_like(gradient)
+    step[:, 0] = (h11 * gradient[:, 0] - h01 * gradient[:, 1]) * scale
+    step[:, 1] = (h00 * gradient[:, 1] - h01 * gradient[:, 0]) * scale
+    return step
+
+def _inverse_2x2(matrices):
+    """
+    Inverse of a stack of symmetric 2x2 information matrices.
+
+    Singular matrices are regularized before inverting, so an unobservable direction
+    (e.g. along a single circle) gets a very large variance instead of zero.
+    """
+    det = matrices[:, 0, 0] * matrices[:, 1, 1] - matrices[:, 0, 1]**2
+    trace = matrices[:, 0, 0] + matrices[:, 1, 1]
+    singular = det <= 1e-12 * trace**2 + 1e-300
+    inverse = np.empty_like(matrices)
+    safe_det = np.where(singular, 1.0, det)
+    inverse[:, 0, 0] = matrices[:, 1, 1] / safe_det
+    inverse[:, 1, 1] = matrices[:, 0, 0] / safe_det
+    inverse[:, 0, 1] = inverse[:, 1, 0] = -matrices[:, 0, 1] / safe_det
+    if singular.any():
+        ridge = 1e-6 * trace[singular] + 1e-12
+        inverse[singular] = np.linalg.inv(matrices[singular] + ridge[:, None, None] * np.eye(2))
+    return inverse
+
+def _refine(points, centers, radii, w, iterations, tol):
+    """Broadcast Levenberg-Marquardt refinement; returns (points, weighted costs, Jacobians)"""
+    damping = np.full(len(points), 1e-3)
+    active = np.ones(len(points), dtype=bool)
+
+    def residuals(p):
+        diff = p[:, None, :] - centers
+        dist = np.sqrt((diff**2).sum(axis=2)) + 1e-12
+        return dist - radii, diff / dist[..., None]
+
+    res, jac = residuals(points)
+    cost = (w * res**2).sum(axis=1)
+    for _ in range(iterations):
+        jw = jac * w[..., None]
+        hessian = np.einsum('nki,nkj->nij', jw, jac)
+        gradient = np.einsum('nki,nk->ni', jw, res)
+        step = _solve_2x2(hessian, gradient, damping)
+
+        candidate = points + step
+        new_res, new_jac = residuals(candidate)
+        new_cost = (w * new_res**2).sum(axis=1)
+        accept = active & (new_cost <= cost)
+
+        points = np.where(accept[:, None], candidate, points)
+        res = np.where(accept[:, None], new_res, res)
+        jac = np.where(accept[:, None, None], new_jac, jac)
+        cost = np.where(accept, new_cost, cost)
+        damping = np.where(accept, damping * 0.3, damping * 10)
+        active &= ~(accept & ((step**2).sum(axis=1) < tol**2))
+        if not active.any():
+            break
+    return points, cost, jac
+
+def triangulate_batch(centers, radii, weights=None, iterations=15, tol=1e-6):
+    """
+    Solve many independent circle-intersection problems in one vectorized call.
+
+    Each problem is started from the linearized closed-form estimate and refined with
+    broadcast Levenberg-Marquardt steps on the residuals |p - c_i| - r_i using the
+    analytic Jacobian. Never raises on degenerate geometry.
+
+    Args:
+        centers (array-like): [n, k, 2] circle centers
+        radii (array-like): [n, k] circle radii
+        weights (array-like): Optional [k] or [n, k] per-circle weights (e.g. 1 / range
+                              variance). Zero weight, or a NaN radius, drops a circle, so
+                              problems with fewer stations can be padded to k.
+    Returns:
+        tuple: (points [n, 2], covariances [n, 2, 2]); covariances are scaled by the
+               residual variance for problems with more than two circles. Problems with
+               no usable circles return NaN.
+    """
+    centers = np.asarray(centers, dtype=float)
+    radii = np.asarray(radii, dtype=float)
+    n, k = radii.shape
+    w = np.ones((n, k)) if weights is None else np.broadcast_to(np.asarray(weights, dtype=float), (n, k)).copy()
+    missing = ~np.isfinite(radii) | ~np.all(np.isfinite(centers), axis=2)
+    w[missing] = 0.0
+    radii = np.where(missing, 0.0, radii)
+    centers = np.where(missing[..., None], 0.0, centers)
+
+    starts, alternates, degenerate = _initial_estimates(centers, radii, w)
+    points, cost, jac = _refine(starts, centers, radii, w, iterations, tol)
+
+    if degenerate.any():
+        idx = np.flatnonzero(degenerate)
+        alt_points, alt_cost, alt_jac = _refine(alternates[idx], centers[idx], radii[idx], w[idx], iterations, tol)
+        better = alt_cost < cost[idx]
+        points[idx[better]] = alt_points[better]
+        cost[idx[better]] = alt_cost[better]
+        jac[idx[better]] = alt_jac[better]
+
+    n_used = np.sum(w > 0, axis=1)
+    dof = n_used - 2
+    sigma2 = np.where(dof > 0, cost / np.maximum(dof, 1), 1.0)
+    covariances = sigma2[:, None, None] * _inverse_2x2(np.einsum('nki,nkj->nij', jac * w[..., None], jac))
+
+    unusable = n_used == 0
+    points[unusable] = np.nan
+    covariances[unusable] = np.nan
+    return points, covariances
+
+def solve_circles(centers, radii, weights=None, iterations=15, tol=1e-6):
+    """
+    Weighted least-squares point closest to the intersection of circles.
+
+    Single-problem form of triangulate_batch.
+
+    Args:
+        centers (array-like): [k, 2] circle centers
+        radii (array-like): [k] circle radii
+        weights (array-like): Optional [k] per-circle weights
+    Returns:
+        tuple: (point [2], covariance [2, 2])
+    """
+    centers = np.asarray(centers, dtype=float).reshape(1, -1, 2)
+    radii = np.asarray(radii, dtype=float).reshape(1, -1)
+    if radii.shape[1] == 0:
+        return np.full(2, np.nan), np.full((2, 2), np.nan)
+    points, covariances = triangulate_batch(centers, radii, weights, iterations, tol)
+    return points[0], covariances[0]
+
+def triangulate_target(circles, weights=None):
     """
     Find the point closest to the intersection of n circles.
     
     Parameters:
         circles (list): Each element is a tuple ((x, y), r) where (x, y) is the center
                        and r is the radius.
+        weights (list): Optional per-circle weights.
     Returns:
-        tuple: Coordinates (x, y) of the closest point to the intersection.
+        ndarray: Coordinates (x, y) of the closest point to the intersection.
     """
-    # Convert input format to list of (x, y, r)
-    circles = [(center[0], center[1], radius) for center, radius in circles]
-    
-    # Objective function
-    def objective(point):
-        x, y = point
-        residuals = [
-            (np.sqrt((x - cx)**2 + (y - cy)**2) - r)**2
-            for cx, cy, r in circles
-        ]
-        return sum(residuals)
-
-    # Initial guess: centroid of circle centers
-    x0 = np.mean([c[0] for c in circles])
-    y0 = np.mean([c[1] for c in circles])
-
-    # Minimize the objective function
-    result = minimize(objective, (x0, y0), method='Powell')
-
-    if result.success:
-        return result.x
-    else:
-        raise ValueError("Optimization failed!")
-    
-import matplotlib.pyplot as plt
+    centers = [center for center, _ in circles]
+    radii = [radius for _, radius in circles]
+    point, _ = solve_circles(centers, radii, weights)
+    return point
 
 def plot_circles_and_point(circles, point):
+    import matplotlib.pyplot as plt
     fig, ax = plt.subplots()
     for cx, cy, r in circles:
         circle = plt.Circle((cx, cy), r, fill=False, linestyle='--')
@@ -1,13 +1,18 @@
 import numpy as np
 
-def calculate_distance(measured_db, reference_db=94.0, reference_distance=1.0):
+def calculate_distance(measured_db, reference_db=94.0, reference_distance=1.0, absorption=0.0):
     """
     Calculate distance to sound source using inverse square law, taking decibel measurements.
+
+    Intensity falls with the square of distance, so pressure (and every 20 log10 level, such as
+    target_power_dB) falls 20 log10(d / reference_distance): the same law as
+    ranging.SpectralRangeEstimator, atmosphere.total_attenuation and simulate.Simulator.
     
     Args:
         measured_db (float): Measured sound pressure level in dB
         reference_db (float): Reference sound pressure level in dB (default: 94.0 dB, typical calibrator level)
         reference_distance (float): Known distance at reference measurement in meters (default: 1.0)
+        absorption (float): Air absorption in dB/m beyond the reference distance (default: 0.0, spreading only)
     
     Returns:
         float: Estimated distance to source in meters
@@ -16,12 +21,20 @@ def calculate_distance(measured_db, reference_db=94.0, reference_distance=1.0):
         This function assumes measurements are sound pressure levels (SPL) referenced to 20 µPa.
         The default reference of 94 dB is a common calibrator level.
     """
-    # Convert dB to intensity ratio
+    # Convert dB to pressure ratio
     # Using P1/P2 = 10^((dB1-dB2)/20)
     pressure_ratio = 10 ** ((reference_db - measured_db) / 20)
     
-    # Apply inverse square law
-    return reference_distance * np.sqrt(pressure_ratio)
+    # Apply inverse square law: pressure is inversely proportional to distance
+    distance = reference_distance * pressure_ratio
+
+    # With absorption the loss is 20 log10(d / d0) + absorption * (d - d0); Newton's method
+    # from the spreading-only distance converges in a few steps
+    loss_db = reference_db - measured_db
+    for _ in range(10 if absorption > 0 else 0):
+        excess = 20 * np.log10(distance / reference_distance) + absorption * (distance - reference_distance) - loss_db
+        distance = max(distance - excess / (20 / (distance * np.log(10)) + absorption), 1e-3)
+    return distance
 
 if __name__ == "__main__":
     # Test values